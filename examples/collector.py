@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+from context import icscrack
+
+import argparse
+import signal
+
+from mini import w_printer
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "--host",
+        help="address to listen on",
+        type=str,
+        default="127.0.0.1"
+    )
+
+    argParser.add_argument(
+        "--port",
+        help="port to listen on",
+        type=int,
+        default=5021
+    )
+
+    argParser.add_argument(
+        "yaml",
+        help="yaml file with automata",
+        type=str
+    )
+
+    args = argParser.parse_args()
+    collector = icscrack.Collector((args.host, args.port), args.yaml, w_printer)
+    signal.signal(signal.SIGHUP, lambda *_: collector.reload())
+    print("[+] Collecting on {}:{}".format(*collector.getAddress()))
+    try:
+        collector.serveForever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("[+] {}".format(collector.getStats()))
+
+
+if __name__ == "__main__":
+    main()
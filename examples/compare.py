@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+from context import icscrack
+
+import argparse
+import scapy.all as scpy
+
+
+SERVER_PORT = 5020
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "--max", "-m",
+        help="maximum number of divergences to report",
+        type=int
+    )
+
+    argParser.add_argument(
+        "pcap",
+        help="pcap file to analyze",
+        type=str
+    )
+
+    argParser.add_argument(
+        "yaml",
+        help="yaml files with automata, one per model version",
+        type=str,
+        nargs="+"
+    )
+
+    args = argParser.parse_args()
+    comparison = icscrack.ModelComparison.fromYamls(args.yaml, args.max)
+    handler = icscrack.BatchHandler(SERVER_PORT, comparison)
+    with scpy.PcapReader(args.pcap) as pcap:
+        for pkt in pcap:
+            handler(pkt)
+
+    handler.flush()
+    print(comparison.report())
+
+
+if __name__ == "__main__":
+    main()
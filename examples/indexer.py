@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+from context import icscrack
+
+import argparse
+
+
+SERVER_PORT = 5020
+
+
+def main():
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "--output", "-o",
+        help="index file path (defaults to <pcap>.idx)",
+        type=str
+    )
+
+    argParser.add_argument(
+        "--port",
+        help="MODBUS server port",
+        type=int,
+        default=SERVER_PORT
+    )
+
+    argParser.add_argument(
+        "--yaml", "-y",
+        help="yaml file with automata to checkpoint along the capture",
+        type=str
+    )
+
+    argParser.add_argument(
+        "--checkpoint-every",
+        help="number of sync points between automata checkpoints",
+        type=int,
+        default=64
+    )
+
+    argParser.add_argument(
+        "pcap",
+        help="pcap file to index",
+        type=str
+    )
+
+    args = argParser.parse_args()
+    output = args.output or "{}.idx".format(args.pcap)
+    automata = icscrack.fromYaml(args.yaml) if args.yaml else None
+    index = icscrack.Index.build(args.pcap, args.port, automata, args.checkpoint_every)
+    index.save(output)
+    print("[+] Indexed {} MODBUS frames into {}".format(len(index), output))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 from context import icscrack
 
 import argparse
+import signal
 import scapy.all as scpy
 import yaml
 
@@ -10,7 +11,7 @@ import yaml
 SERVER_PORT = 5020
 
 
-def w_printer(automata):
+def w_printer(automata, quiet=False):
     def doPrinter(seqNb, parsed):
         for automaton in automata:
             msgL = sum(
@@ -25,14 +26,57 @@ def w_printer(automata):
 
             if msgL:
                 res = automaton.update(dict(msgL))
-                if res is not None:
+                if res is not None and not quiet:
                     state,varsL = res
                     varsL = [(automaton.getVariableName(var),val) for var,val in varsL]
-                    print("[{}] [{}] {} {}".format(seqNb, automaton.getName(), state, varsL))
+                    print("[{}] [{}] {} {}".format(
+                        seqNb,
+                        automaton.getName(),
+                        "|".join(automaton.getAliases(state)),
+                        varsL
+                    ))
 
     return doPrinter
 
 
+def w_seeder(automata):
+    def doSeed(seqNb, parsed):
+        msgL = icscrack.modbus.inputMessages(parsed)
+        for automaton in automata:
+            if msgL:
+                try:
+                    automaton.update(msgL)
+                except icscrack.errors.TransitionError:
+                    pass
+
+    return doSeed
+
+
+def w_reloading(handler, automata, yamlPath):
+    pending = []
+    signal.signal(signal.SIGHUP, lambda *_: pending.append(True))
+
+    def doHandle(pkt):
+        if pending:
+            del pending[:]
+            automata[:] = icscrack.reloadYaml(yamlPath, automata)
+            print("[+] Reloaded {}".format(yamlPath))
+
+        return handler(pkt)
+
+    return doHandle
+
+
+def w_deviations(handler):
+    def doHandle(*args):
+        try:
+            handler(*args)
+        except icscrack.errors.TransitionError as e:
+            print("[!] Deviation: {}".format(e))
+
+    return doHandle
+
+
 def main():
     argParser = argparse.ArgumentParser()
     argParser.add_argument(
@@ -47,6 +91,63 @@ def main():
         action="store_true"
     )
 
+    argParser.add_argument(
+        "--index", "-i",
+        help="sidecar index of the pcap file (see indexer.py)",
+        type=str
+    )
+
+    argParser.add_argument(
+        "--fn-code",
+        help="only analyze frames of this function code (requires --index)",
+        type=int,
+        action="append"
+    )
+
+    argParser.add_argument(
+        "--server",
+        help="only analyze frames exchanged with this server address (requires --index)",
+        type=str
+    )
+
+    argParser.add_argument(
+        "--addresses",
+        help="only analyze frames touching registers FIRST:LAST (requires --index)",
+        type=lambda _: tuple(int(__, 0) for __ in _.split(":", 1))
+    )
+
+    argParser.add_argument(
+        "--start",
+        help="only analyze frames after this timestamp (requires --index)",
+        type=float
+    )
+
+    argParser.add_argument(
+        "--end",
+        help="only analyze frames before this timestamp (requires --index)",
+        type=float
+    )
+
+    argParser.add_argument(
+        "--evidence", "-e",
+        help="directory where frames surrounding deviations are saved",
+        type=str
+    )
+
+    argParser.add_argument(
+        "--collector", "-c",
+        help="host:port of a collector to stream events to (see collector.py)",
+        type=str,
+        action="append"
+    )
+
+    argParser.add_argument(
+        "--workers", "-w",
+        help="number of evaluator processes in live mode",
+        type=int,
+        default=0
+    )
+
     argParser.add_argument(
         "yaml",
         help="yaml file with automata",
@@ -54,26 +155,83 @@ def main():
     )
 
     args = argParser.parse_args()
+    if args.evidence and args.collector:
+        argParser.error("--evidence requires local automata, it cannot be used with --collector")
+    if args.evidence and args.workers:
+        argParser.error("--evidence records packets in this process, it cannot be used with --workers")
+    if args.evidence and args.index:
+        argParser.error("--evidence needs every packet, it cannot be used with --index")
+
     automata = icscrack.fromYaml(args.yaml)
     printer = w_printer(automata)
-    if args.pcap:
+    recorder = None
+    sensor = None
+    handler = icscrack.modbusHandler(SERVER_PORT, printer)
+    if args.evidence:
+        recorder = icscrack.EvidenceRecorder(SERVER_PORT, args.evidence)
+        handler = w_deviations(icscrack.modbusHandler(SERVER_PORT, printer, recorder))
+    elif args.collector:
+        sensor = icscrack.Sensor(
+            SERVER_PORT,
+            [(host, int(port)) for host,port in (_.rsplit(":", 1) for _ in args.collector)]
+        )
+        handler = sensor
+
+    if args.pcap and args.index:
+        if args.verbose:
+            print("[+] Loading pcap {} through index {}".format(args.pcap, args.index))
+
+        icscrack.index.analyze(
+            args.pcap,
+            icscrack.Index.load(args.index),
+            w_deviations(printer),
+            seedCallback=w_seeder(automata),
+            automata=automata,
+            fnCodes=args.fn_code,
+            addresses=args.addresses,
+            start=args.start,
+            end=args.end,
+            server=args.server
+        )
+
+    elif args.pcap:
         if args.verbose:
             print("[+] Loading pcap {}".format(args.pcap))
 
         pcap = scpy.rdpcap(args.pcap)
         for pkt in pcap:
-            res = icscrack.modbusHandler(SERVER_PORT, printer)(pkt)
+            res = handler(pkt)
             if args.verbose and res:
                 print(res)
 
+    elif args.workers:
+        print("[+] Sniffing tcp port {} ({} evaluators)".format(SERVER_PORT, args.workers))
+        pipeline = icscrack.LivePipeline(SERVER_PORT, args.yaml, w_printer, args.workers)
+        pipeline.start()
+        signal.signal(signal.SIGHUP, lambda *_: pipeline.reload())
+        try:
+            scpy.sniff(
+                filter="tcp and port {}".format(SERVER_PORT),
+                iface="vboxnet2",
+                prn=pipeline
+            )
+        finally:
+            for i,stats in enumerate(pipeline.close()):
+                print("[+] Evaluator {}: {}".format(i, stats))
+
     else:
         print("[+] Sniffing tcp port {}".format(SERVER_PORT))
         sniffer = scpy.sniff(
             filter="tcp and port {}".format(SERVER_PORT),
             iface="vboxnet2",
-            prn=icscrack.modbusHandler(SERVER_PORT, printer)
+            prn=handler if sensor is not None else w_reloading(handler, automata, args.yaml)
         )
 
+    if recorder is not None:
+        recorder.flush()
+    if sensor is not None:
+        sensor.close()
+
 
 if __name__ == "__main__":
     main()
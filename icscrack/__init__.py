@@ -1,2 +1,8 @@
-from .core import Automaton, fromYaml
-from .modbus import modbusHandler
+from .core import Automaton, fromYaml, reloadYaml
+from .modbus import modbusHandler, BatchHandler
+from .pipeline import LivePipeline
+from .index import Index
+from .events import EventBatch
+from .compare import ModelComparison
+from .evidence import EvidenceRecorder
+from .transport import Sensor, Collector
@@ -0,0 +1,186 @@
+""" Single-pass comparison of model versions for SACADE tool API. """
+
+##  @file   compare.py
+#   @brief  Single-pass comparison of model versions for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Single-pass comparison of model versions for SACADE tool API.
+#   The same decoded events are fed to several independently loaded sets of
+#   automata and every point where their verdicts diverge is recorded.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import collections
+
+
+from . import errors
+from .core import fromYaml
+from .events import EventBatch
+from .modbus import inputMessages
+
+
+Divergence = collections.namedtuple(
+    "Divergence",
+    ("packet", "seqNb", "automaton", "outcomes")
+)
+
+
+##  Feeds the same events to several model sets and records their divergences.
+#   Instances are valid callbacks for both `modbusHandler` and `BatchHandler`,
+#   so that a capture is decoded once whatever the number of models.
+#   States are given as the names of the JFF states merged into them joined by
+#   "|", two outcomes agreeing when their states share a name so that models
+#   minimized differently do not diverge. The outcome of an automaton for a
+#   packet is one of:
+#       * ("transition", state, outputs) when a transition was taken.
+#       * ("deviation", state) when a `TransitionError` was raised.
+#       * ("none", state) when nothing happened.
+#       * ("absent",) when the model set has no such automaton.
+class ModelComparison(object):
+    """ Feeds the same events to several model sets and records their divergences. """
+
+    ##  Constructor.
+    #   @param  modelSets       List of lists of automata, one per model.
+    #   @param  labels          Names of the models (defaults to indices).
+    #   @param  maxDivergences  Maximum number of divergences kept, further
+    #                           ones are only counted (None keeps them all).
+    def __init__(self, modelSets, labels=None, maxDivergences=None):
+        self._models         = [
+            {automaton.getName(): automaton for automaton in automata}
+            for automata in modelSets
+        ]
+        self._labels         = labels or [str(i) for i in range(len(modelSets))]
+        self._names          = sorted(set().union(*self._models))
+        self._maxDivergences = maxDivergences
+        self._divergences    = []
+        self._counts         = collections.Counter()
+        self._nbPackets      = 0
+
+
+    ##  Returns a comparison of the models described by several Yaml files.
+    #   @param  yamlPaths       Input Yaml file paths, also used as labels.
+    #   @param  maxDivergences  Maximum number of divergences kept.
+    #   @return The comparison of the models.
+    @classmethod
+    def fromYamls(cls, yamlPaths, maxDivergences=None):
+        """ Returns a comparison of the models described by several Yaml files. """
+        return cls([fromYaml(_) for _ in yamlPaths], yamlPaths, maxDivergences)
+
+
+    ##  Feeds a decoded packet, as a `modbusHandler` callback, or a batch of
+    #   packets, as a `BatchHandler` callback.
+    #   @param  seqNb   MODBUS transaction identifier or an `EventBatch`.
+    #   @param  parsed  List of parsed requests or responses.
+    def __call__(self, seqNb, parsed=None):
+        if isinstance(seqNb, EventBatch):
+            batch = seqNb
+            for i in range(batch.nbPackets()):
+                self.feed(batch.seqNbs[i], batch.messages(i))
+        else:
+            self.feed(seqNb, inputMessages(parsed))
+
+
+    ##  Feeds the input messages of a packet to every model.
+    #   @param  seqNb   MODBUS transaction identifier.
+    #   @param  msgL    Input messages (variables mappings to values).
+    def feed(self, seqNb, msgL):
+        """ Feeds the input messages of a packet to every model. """
+        self._nbPackets += 1
+        if not msgL:
+            return
+
+        for name in self._names:
+            outcomes = [self._outcome(model.get(name), msgL) for model in self._models]
+            if not all(self._agree(outcomes[0], _) for _ in outcomes[1:]):
+                self._counts[name] += 1
+                if self._maxDivergences is None or len(self._divergences) < self._maxDivergences:
+                    self._divergences.append(Divergence(
+                        self._nbPackets - 1,
+                        seqNb,
+                        name,
+                        dict(zip(self._labels, outcomes))
+                    ))
+
+
+    @staticmethod
+    def _outcome(automaton, msgL):
+        if automaton is None:
+            return ("absent",)
+
+        try:
+            res = automaton.update(msgL)
+        except errors.TransitionError:
+            return ("deviation", "|".join(automaton.getAliases(automaton.getState())))
+
+        if res is None:
+            return ("none", "|".join(automaton.getAliases(automaton.getState())))
+
+        state,varsL = res
+        return ("transition", "|".join(automaton.getAliases(state)), tuple(
+            (automaton.getVariableName(var), val) for var,val in varsL
+        ))
+
+
+    @staticmethod
+    def _agree(outcome1, outcome2):
+        if outcome1[0] != outcome2[0] or outcome1[2:] != outcome2[2:]:
+            return False
+
+        return len(outcome1) < 2 or bool(
+            set(outcome1[1].split("|")) & set(outcome2[1].split("|"))
+        )
+
+
+    ##  Returns the recorded divergences.
+    #   @return The list of divergences, in packets order.
+    def getDivergences(self):
+        """ Returns the recorded divergences. """
+        return self._divergences
+
+
+    ##  Returns the number of divergences of each automaton.
+    #   @return A dict mapping automata names to divergences counts.
+    def getCounts(self):
+        """ Returns the number of divergences of each automaton. """
+        return dict(self._counts)
+
+
+    ##  Returns a human readable report of the comparison.
+    #   @return The report as a string.
+    def report(self):
+        """ Returns a human readable report of the comparison. """
+        lines = ["{} packets compared across {} models: {}".format(
+            self._nbPackets,
+            len(self._models),
+            ", ".join(self._labels)
+        )]
+        for name in self._names:
+            lines.append("[{}] {} divergences".format(name, self._counts[name]))
+
+        for divergence in self._divergences:
+            lines.append("[{}] [{}] packet {}:".format(
+                divergence.seqNb,
+                divergence.automaton,
+                divergence.packet
+            ))
+            for label,outcome in divergence.outcomes.items():
+                lines.append("    {}: {}".format(label, " ".join(map(str, outcome))))
+
+        return "\n".join(lines)
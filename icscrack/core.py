@@ -28,6 +28,10 @@
 import os
 import re
 import ast
+import copy
+import hashlib
+import warnings
+import concurrent.futures
 import xml.etree.ElementTree as ET
 import yaml
 
@@ -35,31 +39,279 @@ import yaml
 from . import errors
 
 
-##  Returns as many automata instance as behaviors provided in a Yaml file.
-##  @param  yamlPath Input Yaml file path.
-#   @return The list of automata from a Yaml file.
-def fromYaml(yamlPath):
-    """ Returns as many automata instance as behaviors provided in a Yaml file. """
+##  Returns the behavior entries of the agents of a Yaml file.
+#   Agents without behavior are skipped with a warning, agents with a behavior
+#   but no variables raise a ParseError.
+#   @param  yamlPath Input Yaml file path.
+#   @return A list of (name, behavior path, variables) tuples, servers first.
+def _yamlAgents(yamlPath):
     with open(yamlPath, "r") as handle:
-        yamlObj = yaml.load(handle.read())
+        yamlObj = yaml.safe_load(handle.read())
 
     agents = yamlObj["topology"]["servers"].copy()
     agents.update(yamlObj["topology"]["clients"])
     res = []
     for name, attributes in agents.items():
-        try:
-            variables = {k:tuple(v) for k,v in attributes["variables"].items()}
-            behavior = "{}/{}".format(
-                os.path.dirname(yamlPath),
-                attributes["behavior"]
-            )
-            res.append(Automaton.fromJFF(name, behavior, variables))
-        except KeyError:
-            pass
+        if "behavior" not in attributes:
+            warnings.warn("{}: no behavior in {}, agent not monitored".format(name, yamlPath))
+            continue
+        if "variables" not in attributes:
+            raise errors.ParseError("{}: behavior without variables in {}".format(name, yamlPath))
+
+        variables = {k:tuple(v) for k,v in attributes["variables"].items()}
+        behavior = "{}/{}".format(
+            os.path.dirname(yamlPath),
+            attributes["behavior"]
+        )
+        res.append((name, behavior, variables))
+
+    return res
+
+
+##  Returns the source signatures of agents behaviors.
+#   Agents with the same signature share the same compiled automaton. Each
+#   behavior file is read and hashed once, whatever its number of agents.
+#   @param  agents  List of (name, behavior path, variables) tuples.
+#   @return A dict mapping agents names to a tuple of their JFF file digest
+#           and their sorted variables mappings.
+def _signatures(agents):
+    digests = {}
+    res = {}
+    for name,behavior,variables in agents:
+        if behavior not in digests:
+            with open(behavior, "rb") as handle:
+                digests[behavior] = hashlib.sha1(handle.read()).hexdigest()
+
+        res[name] = (digests[behavior], tuple(sorted(variables.items())))
+
+    return res
+
+
+##  Compiles the automata of Yaml agents, once per distinct behavior.
+#   @param  agents      List of (name, behavior path, variables) tuples.
+#   @param  signatures  Dict mapping agents names to their signature.
+#   @param  workers     Number of worker processes (None compiles in the
+#                       calling process).
+#   @return A dict mapping agents names to their automaton.
+def _compileAgents(agents, signatures, workers):
+    compiled = {}
+    jobs = {}
+    for name,behavior,variables in agents:
+        jobs.setdefault(signatures[name], []).append((name, behavior, variables))
+
+    if workers is None or len(jobs) < 2:
+        results = [Automaton.fromJFF(*entries[0]) for entries in jobs.values()]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(
+                Automaton.fromJFF,
+                *zip(*(entries[0] for entries in jobs.values()))
+            ))
+
+    for (signature,entries),automaton in zip(jobs.items(), results):
+        automaton._source = signature
+        for name,_,_ in entries:
+            compiled[name] = automaton.clone(name)
+
+    return compiled
+
+
+##  Returns as many automata instance as behaviors provided in a Yaml file.
+#   Agents sharing the same behavior file and variables share the same
+#   compiled transitions tables.
+##  @param  yamlPath Input Yaml file path.
+#   @param  workers  Number of worker processes compiling behaviors (None
+#                    compiles them in the calling process).
+#   @return The list of automata from a Yaml file.
+def fromYaml(yamlPath, workers=None):
+    """ Returns as many automata instance as behaviors provided in a Yaml file. """
+    agents = _yamlAgents(yamlPath)
+    compiled = _compileAgents(agents, _signatures(agents), workers)
+    return [compiled[name] for name,_,_ in agents]
+
+
+##  Reloads the automata of a Yaml file, rebuilding only the changed ones.
+#   Automata whose Yaml entry and behavior file are unchanged are kept as is,
+#   along with their current state and variables values.
+#   @param  yamlPath Input Yaml file path.
+#   @param  automata Automata currently loaded from this Yaml file.
+#   @param  workers  Number of worker processes compiling behaviors.
+#   @return The list of automata from a Yaml file.
+def reloadYaml(yamlPath, automata, workers=None):
+    """ Reloads the automata of a Yaml file, rebuilding only the changed ones. """
+    current = {automaton.getName(): automaton for automaton in automata}
+    agents = _yamlAgents(yamlPath)
+    signatures = _signatures(agents)
+    kept = {}
+    changed = []
+    for name,behavior,variables in agents:
+        automaton = current.get(name)
+        if automaton is not None and automaton.getSource() == signatures[name]:
+            kept[name] = automaton
+        else:
+            changed.append((name, behavior, variables))
+
+    kept.update(_compileAgents(changed, signatures, workers))
+    return [kept[name] for name,_,_ in agents]
+
+
+##  Partitions states of a Mealy machine into equivalence blocks.
+#   @param  reachable   Reachable states.
+#   @param  successors  Leaving transitions of each state (state to list of
+#                       (guard, state)).
+#   @param  outputFunc  Output function ((state, state) to output).
+#   @param  pinned      States kept alone in their block.
+#   @return A dict mapping states to their block.
+def _partitionMealy(reachable, successors, outputFunc, pinned):
+    labels = {}
+    blocks = {
+        state: labels.setdefault(state if state in pinned else None, len(labels))
+        for state in reachable
+    }
+    while True:
+        signatures = {}
+        refined = {}
+        for state in reachable:
+            signature = (blocks[state], frozenset(
+                (frozenset(guard), tuple(outputFunc[(state, newState)]), blocks[newState])
+                for guard,newState in successors.get(state, [])
+            ))
+            refined[state] = signatures.setdefault(signature, len(signatures))
+
+        if len(signatures) == len(set(blocks.values())):
+            return blocks
+        blocks = refined
+
+
+##  Merges the equivalent states of a Mealy machine and drops unreachable ones.
+#   Two states are equivalent when every guard leads both of them to
+#   equivalent states with the same output. As outputs are keyed by source and
+#   destination states, states reached from a same state with different
+#   outputs are never merged together.
+#   @param  states      States of the automaton (identifier to name).
+#   @param  start       Name of the start state.
+#   @param  transFunc   Transition function ((state, guard) to state).
+#   @param  outputFunc  Output function ((state, state) to output).
+#   @return A tuple containing the minimized states, transition function,
+#           output function and the names of the states merged into each kept
+#           state.
+def minimizeMealy(states, start, transFunc, outputFunc):
+    """ Merges the equivalent states of a Mealy machine and drops unreachable ones. """
+    successors = {}
+    for (state,guard),newState in transFunc.items():
+        successors.setdefault(state, []).append((guard, newState))
+
+    reachable = [start]
+    for state in reachable:
+        for _,newState in successors.get(state, []):
+            if newState not in reachable:
+                reachable.append(newState)
+
+    pinned = set()
+    while True:
+        blocks = _partitionMealy(reachable, successors, outputFunc, pinned)
+        targets = {}
+        for state in reachable:
+            for _,newState in successors.get(state, []):
+                targets.setdefault((state, blocks[newState]), {}).setdefault(
+                    tuple(outputFunc[(state, newState)]), set()
+                ).add(newState)
+
+        collisions = set()
+        for byOutput in targets.values():
+            if len(byOutput) > 1:
+                collisions.update(*byOutput.values())
+
+        if not collisions:
+            break
+        pinned |= collisions
+
+    representatives = {}
+    for state in sorted(reachable, key=lambda _: _ != start):
+        representatives.setdefault(blocks[state], state)
+    rep = {state: representatives[blocks[state]] for state in reachable}
+
+    aliases = {}
+    for state in reachable:
+        aliases.setdefault(rep[state], []).append(state)
+
+    newStates = {k: v for k,v in states.items() if v in representatives.values()}
+    newTransFunc = {}
+    newOutputFunc = {}
+    for (state,guard),newState in transFunc.items():
+        if rep.get(state) == state:
+            newTransFunc[(state, guard)] = rep[newState]
+            newOutputFunc[(state, rep[newState])] = outputFunc[(state, newState)]
+
+    return newStates, newTransFunc, newOutputFunc, {k: tuple(v) for k,v in aliases.items()}
+
+
+##  Orders guards so that a guard is tried before any guard it strictly
+#   contains, keeping the JFF order otherwise. Unsatisfiable guards (testing
+#   a variable against both values) contain nothing.
+#   @param  trans   List of (guard, state) in JFF order.
+#   @return The ordered list of (guard, state).
+def _orderGuards(trans):
+    remaining = list(trans)
+    res = []
+    while remaining:
+        for i,(guard,_) in enumerate(remaining):
+            if not any(
+                set(guard) < set(other) and len(dict(other)) == len(set(other))
+                for other,_ in remaining
+            ):
+                res.append(remaining.pop(i))
+                break
 
     return res
 
 
+##  Analyzes the guards leaving each state of an automaton.
+#   Guards are tried in JFF order, except that a guard strictly containing
+#   another one is tried first so that it is not shadowed by it.
+#   Two guards of a same state overlap when they test no common variable with
+#   different values. Overlapping guards leading to different states or
+#   outputs are reported as "shadowed" if one is more specific than the other
+#   (resolved by the ordering) or "nondeterministic" otherwise (the first one
+#   in JFF order wins). Overlapping guards with identical effects are reported
+#   as "redundant".
+#   @param  transFunc   Transition function ((state, guard) to state).
+#   @param  outputFunc  Output function ((state, state) to output).
+#   @return A tuple containing the ordered guards of each state (state to list
+#           of (guard, state)) and the list of conflicts as (kind, state,
+#           guard, guard) tuples.
+def analyzeGuards(transFunc, outputFunc):
+    """ Analyzes the guards leaving each state of an automaton. """
+    guards = {}
+    for (state,guard),newState in transFunc.items():
+        guards.setdefault(state, []).append((guard, newState))
+
+    conflicts = []
+    for state in guards:
+        trans = guards[state] = _orderGuards(guards[state])
+        for i,(guard1,newState1) in enumerate(trans):
+            literals1 = dict(guard1)
+            if len(literals1) != len(set(guard1)):
+                conflicts.append(("unsatisfiable", state, guard1, guard1))
+                continue
+
+            for guard2,newState2 in trans[i+1:]:
+                literals2 = dict(guard2)
+                if any(literals2.get(var, val) != val for var,val in literals1.items()):
+                    continue
+
+                if (newState1 == newState2
+                        and outputFunc[(state, newState1)] == outputFunc[(state, newState2)]):
+                    kind = "redundant"
+                elif set(guard2) < set(guard1):
+                    kind = "shadowed"
+                else:
+                    kind = "nondeterministic"
+                conflicts.append((kind, state, guard1, guard2))
+
+    return guards, conflicts
+
+
 class Automaton(object):
     _name       = None
     _states     = None
@@ -68,16 +320,23 @@ class Automaton(object):
     _transFunc  = None
     _outputFunc = None
     _current    = None
+    _guards     = None
+    _conflicts  = None
+    _source     = None
+    _aliases    = None
 
-    def __init__(self, name, states, start, variables, transFunc, outputFunc):
+    def __init__(self, name, states, start, variables, transFunc, outputFunc,
+                 aliases=None):
         self._name       = name
         self._states     = states
         self._start      = start
         self._variables  = variables
         self._transFunc  = transFunc
         self._outputFunc = outputFunc
+        self._aliases    = aliases or {}
         self._values     = {k: None for k in self._variables.values()}
 
+        self._guards,self._conflicts = analyzeGuards(transFunc, outputFunc)
         self._current    = self._start
 
 
@@ -88,6 +347,72 @@ class Automaton(object):
         return self._name
 
 
+    ##  Returns the current state of the automaton.
+    #   @return The name of the current state.
+    def getState(self):
+        """ Returns the current state of the automaton. """
+        return self._current
+
+
+    ##  Returns the variables mappings of the automaton.
+    #   @return A dict mapping variables names to their mappings.
+    def getVariables(self):
+        """ Returns the variables mappings of the automaton. """
+        return self._variables
+
+
+    ##  Returns the source signature the automaton was compiled from.
+    #   @return A tuple of the JFF file digest and the sorted variables
+    #           mappings, or None if not loaded from a Yaml file.
+    def getSource(self):
+        """ Returns the source signature the automaton was compiled from. """
+        return self._source
+
+
+    ##  Returns a fresh automaton sharing the transitions tables of this one.
+    #   @param  name    Name of the new automaton.
+    #   @return The new automaton, in its start state.
+    def clone(self, name):
+        """ Returns a fresh automaton sharing the transitions tables of this one. """
+        res = copy.copy(self)
+        res._name    = name
+        res._values  = {k: None for k in self._variables.values()}
+        res._current = self._start
+        return res
+
+
+    ##  Returns a snapshot of the current state and variables values.
+    #   @return A tuple containing the current state and a dict of the
+    #           variables values (mappings to values).
+    def getCheckpoint(self):
+        """ Returns a snapshot of the current state and variables values. """
+        return self._current, dict(self._values)
+
+
+    ##  Restores a snapshot of the current state and variables values.
+    #   @param  checkpoint  Snapshot, as returned by `getCheckpoint`.
+    def restore(self, checkpoint):
+        """ Restores a snapshot of the current state and variables values. """
+        current,values = checkpoint
+        self._current = current
+        self._values = {k: values.get(k) for k in self._variables.values()}
+
+
+    ##  Returns the names of the states of the JFF file merged into a state.
+    #   @param  state   Name of a state of the automaton.
+    #   @return A tuple of the names of the merged states, `state` first.
+    def getAliases(self, state):
+        """ Returns the names of the states of the JFF file merged into a state. """
+        return self._aliases.get(state, (state,))
+
+
+    ##  Returns the guards conflicts found when loading the automaton.
+    #   @return A list of (kind, state, guard, guard) tuples.
+    def getConflicts(self):
+        """ Returns the guards conflicts found when loading the automaton. """
+        return self._conflicts
+
+
     ##  Returns the name of a variable from its mapping.
     #   @param  mapping Mapping of the variable.
     #   @return The name of a variable from its mapping or None if not found.
@@ -123,10 +448,9 @@ class Automaton(object):
 
 
         inputs,ignored = _computeInputs(msgL)
-        for state,varsL in self._transFunc.keys():
+        for varsL,newState in self._guards.get(self._current, []):
             transVars = _removeIgnored(set(varsL), ignored)
-            if self._current == state and transVars and transVars.issubset(inputs):
-                newState = self._transFunc[(state, varsL)]
+            if transVars and transVars.issubset(inputs):
                 res = self._outputFunc[(self._current, newState)]
 
                 self._current = newState
@@ -155,20 +479,26 @@ class Automaton(object):
     #   @param  name        Name of the automaton.
     #   @param  jffPath     Input JFF file path.
     #   @param  variables   Variables mappings.
+    #   @param  minimize    Merges equivalent states and drops unreachable ones.
+    #   @param  strict      Raises on nondeterministic guards.
     #   @return An automaton from a JFF file.
     @classmethod
-    def fromJFF(cls, name, jffPath, variables):
+    def fromJFF(cls, name, jffPath, variables, minimize=True, strict=False):
         """ Returns an automaton from a JFF file. """
         pattern = re.compile("(\w+), (\w+)")
         def _parseTrans(trans):
             res = []
             if trans is not None:
                 for varName,val in pattern.findall(trans):
+                    if varName not in variables:
+                        raise errors.ParseError("{}: unknown variable {} in {}".format(
+                            name, varName, jffPath
+                        ))
                     res += [(tuple(variables[varName]), val == "True")]
 
             return res
 
-        typ,auto = ET.parse(jffPath).getroot().getchildren()
+        typ,auto = list(ET.parse(jffPath).getroot())
         if typ.text != "mealy":
             raise errors.ParseError("Mealy automaton expected!")
 
@@ -176,26 +506,44 @@ class Automaton(object):
         start      = None
         transFunc  = {}
         outputFunc = {}
-        for node in auto.getchildren():
+        for node in auto:
             if node.tag == "state":
                 nodeId = node.get("id")
                 nodeName = node.get("name")
                 states[nodeId] = nodeName
-                if any(_.tag == "initial" for _ in node.getchildren()):
+                if any(_.tag == "initial" for _ in node):
                     start = nodeName
             elif node.tag == "transition":
-                nodeFrom,nodeTo,trans,output = [_.text for _ in node.getchildren()]
+                nodeFrom,nodeTo,trans,output = [_.text for _ in node]
                 trans = _parseTrans(trans)
                 output = _parseTrans(output)
 
                 transFunc[(states[nodeFrom], tuple(trans))] = states[nodeTo]
                 outputFunc[(states[nodeFrom], states[nodeTo])] = output
 
-        return cls(
+        aliases = None
+        if minimize:
+            states,transFunc,outputFunc,aliases = minimizeMealy(
+                states,
+                start,
+                transFunc,
+                outputFunc
+            )
+
+        res = cls(
             name,
             states,
             start,
             variables,
             transFunc,
-            outputFunc
+            outputFunc,
+            aliases
         )
+        if strict:
+            for kind,state,guard1,guard2 in res.getConflicts():
+                if kind == "nondeterministic":
+                    raise errors.ParseError("{}: nondeterministic guards {} and {} in state {}".format(
+                        name, guard1, guard2, state
+                    ))
+
+        return res
@@ -70,3 +70,26 @@ class ParseError(Exception):
     #   @return The string representation of the exception.
     def __str__(self):
         return str(self._value)
+
+
+##  Capture file error.
+class CaptureError(Exception):
+    """ Capture file error. """
+
+    ##  @var _value
+    #   Value of the exception.
+    _value = None
+
+    ##  Constructor.
+    #   @param  value   Value to assign to the exception.
+    def __init__(self,
+                 value
+                ):
+        super(CaptureError, self).__init__(value)
+        self._value = value
+
+
+    ##  String representation of the exception.
+    #   @return The string representation of the exception.
+    def __str__(self):
+        return str(self._value)
@@ -0,0 +1,233 @@
+""" Compact MODBUS event batches for SACADE tool API. """
+
+##  @file   events.py
+#   @brief  Compact MODBUS event batches for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Compact MODBUS event batches for SACADE tool API.
+#   A batch stores the events of many packets in parallel typed arrays rather
+#   than in one tuple per register.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import struct
+import sys
+from array import array
+
+
+KINDS = ("ReadReq", "ReadResp", "WriteReq", "WriteResp")
+TYPES = ("Coil", "DiscreteInput", "HoldingRegister", "InputRegister")
+
+##  Kinds of events carrying values that automata consume as inputs.
+INPUT_KINDS = ("ReadResp", "WriteReq")
+
+##  Value of events without value (read requests, multiple write responses).
+NO_VALUE = -1
+
+_KIND_IDS = {kind: i for i,kind in enumerate(KINDS)}
+_TYPE_IDS = {dtype: i for i,dtype in enumerate(TYPES)}
+_BOOLEAN_TYPES = (_TYPE_IDS["Coil"], _TYPE_IDS["DiscreteInput"])
+_PACKET_COLUMNS = ("starts", "seqNbs", "flows", "times")
+
+
+##  Events of many MODBUS packets stored column-wise.
+#   Events columns (`kinds`, `types`, `addresses`, `values`) have one item per
+#   register while packets columns (`starts`, `seqNbs`, `flows`, `times`) have
+#   one item per packet, `starts` giving the index of its first event.
+class EventBatch(object):
+    """ Events of many MODBUS packets stored column-wise. """
+
+    __slots__ = (
+        "kinds", "types", "addresses", "values",
+        "starts", "seqNbs", "flows", "times"
+    )
+
+    ##  Constructor.
+    def __init__(self):
+        self.kinds     = array("B")
+        self.types     = array("B")
+        self.addresses = array("H")
+        self.values    = array("i")
+        self.starts    = array("I")
+        self.seqNbs    = array("H")
+        self.flows     = array("I")
+        self.times     = array("d")
+
+
+    ##  Returns the number of events of the batch.
+    #   @return The number of events of the batch.
+    def __len__(self):
+        return len(self.kinds)
+
+
+    ##  Returns the number of packets of the batch.
+    #   @return The number of packets of the batch.
+    def nbPackets(self):
+        """ Returns the number of packets of the batch. """
+        return len(self.starts)
+
+
+    ##  Empties the batch, keeping its arrays.
+    def clear(self):
+        """ Empties the batch. """
+        for column in self.__slots__:
+            del getattr(self, column)[:]
+
+
+    ##  Starts a new packet, following events belong to it.
+    #   @param  seqNb   MODBUS transaction identifier.
+    #   @param  flow    Flow identifier of the packet.
+    #   @param  ts      Timestamp of the packet.
+    def beginPacket(self, seqNb, flow=0, ts=0.):
+        """ Starts a new packet. """
+        self.starts.append(len(self.kinds))
+        self.seqNbs.append(seqNb)
+        self.flows.append(flow)
+        self.times.append(ts)
+
+
+    ##  Removes the last packet if it has no event.
+    def dropEmptyPacket(self):
+        """ Removes the last packet if it has no event. """
+        if self.starts and self.starts[-1] == len(self.kinds):
+            for column in _PACKET_COLUMNS:
+                getattr(self, column).pop()
+
+
+    ##  Appends events of a same kind and data type to the current packet.
+    #   @param  kind        Kind of the events (ReadReq, ReadResp, ...).
+    #   @param  dtype       Data type of the events (Coil, HoldingRegister, ...).
+    #   @param  addresses   Addresses of the events.
+    #   @param  values      Values of the events or None.
+    def extend(self, kind, dtype, addresses, values=None):
+        """ Appends events of a same kind and data type to the current packet. """
+        nb = len(addresses)
+        self.kinds.extend(array("B", [_KIND_IDS[kind]]) * nb)
+        self.types.extend(array("B", [_TYPE_IDS[dtype]]) * nb)
+        self.addresses.extend(addresses)
+        if values is None:
+            self.values.extend(array("i", [NO_VALUE]) * nb)
+        else:
+            # Arrays only extend from arrays of the same type code.
+            self.values.extend(iter(values))
+
+
+    ##  Appends a packet of another batch.
+    #   @param  batch   Event batch holding the packet.
+    #   @param  i       Index of the packet in `batch`.
+    def appendPacket(self, batch, i):
+        """ Appends a packet of another batch. """
+        seqNb,flow,ts,start,stop = batch.packet(i)
+        self.beginPacket(seqNb, flow, ts)
+        for column in ("kinds", "types", "addresses", "values"):
+            getattr(self, column).extend(getattr(batch, column)[start:stop])
+
+
+    ##  Serializes the batch, columns are written in little endian order.
+    #   @return The serialized batch.
+    def toBytes(self):
+        """ Serializes the batch. """
+        res = [struct.pack("<II", len(self.starts), len(self.kinds))]
+        for column in self.__slots__:
+            column = getattr(self, column)
+            if sys.byteorder == "big":
+                column = array(column.typecode, column)
+                column.byteswap()
+            res.append(column.tobytes())
+
+        return b"".join(res)
+
+
+    ##  Deserializes a batch.
+    #   @param  data    Serialized batch, as returned by `toBytes`.
+    #   @return The deserialized batch.
+    @classmethod
+    def fromBytes(cls, data):
+        """ Deserializes a batch. """
+        res = cls()
+        nbPackets,nbEvents = struct.unpack_from("<II", data)
+        offset = struct.calcsize("<II")
+        for name in cls.__slots__:
+            column = getattr(res, name)
+            size = (nbPackets if name in _PACKET_COLUMNS else nbEvents) * column.itemsize
+            column.frombytes(data[offset:offset+size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            offset += size
+
+        return res
+
+
+    ##  Returns the bounds and metadata of a packet.
+    #   @param  i   Index of the packet.
+    #   @return A tuple containing the MODBUS transaction identifier, the flow
+    #           identifier, the timestamp, the index of the first event and
+    #           the index after the last event of the packet.
+    def packet(self, i):
+        """ Returns the bounds and metadata of a packet. """
+        stop = self.starts[i + 1] if i + 1 < len(self.starts) else len(self.kinds)
+        return self.seqNbs[i], self.flows[i], self.times[i], self.starts[i], stop
+
+
+    ##  Returns the value of an event with its natural type.
+    #   @param  j   Index of the event.
+    #   @return The value of the event (bool for coils and discrete inputs).
+    def value(self, j):
+        """ Returns the value of an event with its natural type. """
+        if self.types[j] in _BOOLEAN_TYPES:
+            return bool(self.values[j])
+
+        return self.values[j]
+
+
+    ##  Returns the input messages of a packet, as given to `Automaton.update`.
+    #   @param  i       Index of the packet.
+    #   @param  kinds   Kinds of events to consider.
+    #   @return A dict mapping variables mappings to their values.
+    def messages(self, i, kinds=INPUT_KINDS):
+        """ Returns the input messages of a packet. """
+        kindIds = [_KIND_IDS[_] for _ in kinds]
+        _,_,_,start,stop = self.packet(i)
+        return {
+            (TYPES[self.types[j]], self.addresses[j]): self.value(j)
+            for j in range(start, stop)
+            if self.kinds[j] in kindIds and self.values[j] != NO_VALUE
+        }
+
+
+    ##  Returns a packet in the nested lists format of the MODBUS handlers.
+    #   @param  i   Index of the packet.
+    #   @return A list of parsed requests or responses.
+    def toParsed(self, i):
+        """ Returns a packet in the nested lists format of the MODBUS handlers. """
+        _,_,_,start,stop = self.packet(i)
+        res = []
+        for j in range(start, stop):
+            kind = KINDS[self.kinds[j]]
+            if not res or res[-1][0] != kind:
+                res.append((kind, []))
+
+            var = (TYPES[self.types[j]], self.addresses[j])
+            if self.values[j] == NO_VALUE:
+                res[-1][1].append(var)
+            else:
+                res[-1][1].append((var, self.value(j)))
+
+        return res
@@ -0,0 +1,152 @@
+""" Deviations evidence recording for SACADE tool API. """
+
+##  @file   evidence.py
+#   @brief  Deviations evidence recording for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Deviations evidence recording for SACADE tool API.
+#   Recent raw frames are kept in fixed-size per-flow ring buffers. When a
+#   deviation occurs, the frames preceding it and the ones following it on the
+#   same flow are written out as a small pcap file. Deviations following each
+#   other on a flow extend the same file instead of starting new ones.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import collections
+import os
+
+import scapy.all as scpy
+
+
+from .modbus import flowId
+from .pcap import rawFrame, writeCapture
+
+
+##  Keeps recent raw frames of each flow and exports them around deviations.
+#   Memory is bounded by `maxFlows * before` frames for the rings plus
+#   `maxPending * maxFrames` frames for the exports waiting for their
+#   following frames. Least recently seen flows are forgotten first, the
+#   oldest pending export is written early when too many are waiting and an
+#   export is written as soon as it holds `maxFrames` frames.
+class EvidenceRecorder(object):
+    """ Keeps recent raw frames of each flow and exports them around deviations. """
+
+    ##  Constructor.
+    #   @param  serverPort  MODBUS server TCP port.
+    #   @param  outputDir   Directory of the exported pcap files, created if
+    #                       missing.
+    #   @param  before      Number of frames kept before a deviation.
+    #   @param  after       Number of frames exported after a deviation.
+    #   @param  maxFlows    Maximum number of flows tracked at once.
+    #   @param  maxPending  Maximum number of exports waiting for frames.
+    #   @param  maxFrames   Maximum number of frames of an export.
+    def __init__(self, serverPort, outputDir, before=32, after=32, maxFlows=256,
+                 maxPending=16, maxFrames=1024):
+        self._serverPort = serverPort
+        self._outputDir  = outputDir
+        self._before     = before
+        self._after      = after
+        self._maxFlows   = maxFlows
+        self._maxPending = maxPending
+        self._maxFrames  = max(maxFrames, before + 1)
+        self._rings      = collections.OrderedDict()
+        self._pending    = collections.OrderedDict()
+        self._lastFlow   = None
+        self._nbExports  = 0
+        os.makedirs(outputDir, exist_ok=True)
+
+
+    ##  Records a frame into the ring of its flow.
+    #   Frames that are not TCP frames of the MODBUS server are ignored.
+    #   @param  pkt Scapy packet.
+    def record(self, pkt):
+        """ Records a frame into the ring of its flow. """
+        if scpy.TCP not in pkt or self._serverPort not in (pkt[scpy.TCP].sport, pkt[scpy.TCP].dport):
+            return
+
+        flow = flowId(pkt, self._serverPort)
+        frame = (float(pkt.time),) + rawFrame(pkt)
+        self._lastFlow = flow
+
+        for path,(pendingFlow,frames,remaining) in list(self._pending.items()):
+            if pendingFlow == flow:
+                frames.append(frame)
+                if remaining <= 1 or len(frames) >= self._maxFrames:
+                    self._export(path)
+                else:
+                    self._pending[path] = (pendingFlow, frames, remaining - 1)
+
+        if flow in self._rings:
+            self._rings.move_to_end(flow)
+        else:
+            if len(self._rings) >= self._maxFlows:
+                self._rings.popitem(last=False)
+            self._rings[flow] = collections.deque(maxlen=self._before)
+
+        self._rings[flow].append(frame)
+
+
+    ##  Starts the export of the frames surrounding a deviation.
+    #   The recorded frames of the flow are exported along with its next
+    #   `after` frames, once recorded. If an export of the flow is still
+    #   waiting for frames, it is extended to the `after` frames following
+    #   this deviation instead.
+    #   @param  flow    Flow identifier, defaults to the last recorded flow.
+    #   @return The path of the pcap file that will hold the evidence, or None
+    #           if no frame of the flow was recorded.
+    def trigger(self, flow=None):
+        """ Starts the export of the frames surrounding a deviation. """
+        flow = self._lastFlow if flow is None else flow
+        if flow not in self._rings:
+            return None
+
+        for path,(pendingFlow,frames,_) in self._pending.items():
+            if pendingFlow == flow:
+                self._pending[path] = (flow, frames, self._after)
+                return path
+
+        frames = list(self._rings[flow])
+        path = os.path.join(self._outputDir, "deviation-{:08x}-{:.6f}-{}.pcap".format(
+            flow,
+            frames[-1][0],
+            self._nbExports
+        ))
+        self._nbExports += 1
+
+        if len(self._pending) >= self._maxPending:
+            self._export(next(iter(self._pending)))
+
+        self._pending[path] = (flow, frames, self._after)
+        if not self._after:
+            self._export(path)
+
+        return path
+
+
+    def _export(self, path):
+        _,frames,_ = self._pending.pop(path)
+        writeCapture(path, frames[0][1], [(ts, data) for ts,_,data in frames])
+
+
+    ##  Writes every pending export with the frames recorded so far.
+    def flush(self):
+        """ Writes every pending export with the frames recorded so far. """
+        for path in list(self._pending):
+            self._export(path)
@@ -0,0 +1,391 @@
+""" Sidecar index of MODBUS captures for SACADE tool API. """
+
+##  @file   index.py
+#   @brief  Sidecar index of MODBUS captures for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Sidecar index of MODBUS captures for SACADE tool API.
+#   The index holds one fixed-size entry per MODBUS frame of a capture, so
+#   that analyses restricted to a flow, a function code, a registers range or
+#   a time window only read the matching frames.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import bisect
+import collections
+import json
+import struct
+
+import scapy.all as scpy
+
+
+from . import errors
+from . import modbus
+from .pcap import CaptureFile
+
+
+MAGIC = b"ICSX"
+VERSION = 2
+
+##  Index header: magic, version, server port, link type, number of entries.
+HEADER = struct.Struct("<4sHHIQ")
+
+##  Size of the JSON trailer following the entries (version 2 and later).
+TRAILER = struct.Struct("<Q")
+
+##  Index entry: frame offset, timestamp, flow, transaction id, function code,
+#   flags, first address, number of addresses.
+ENTRY = struct.Struct("<QdIHBBHH")
+
+FLAG_RESPONSE = 0x1
+FLAG_SYNC = 0x2
+
+
+IndexEntry = collections.namedtuple(
+    "IndexEntry",
+    ("offset", "ts", "flow", "seqNb", "fnCode", "flags", "first", "nbAddr")
+)
+
+
+##  Returns the range of addresses touched by a parsed packet.
+#   @param  parsed  List of parsed requests or responses.
+#   @return A tuple containing the first address and the number of addresses.
+def _addressRange(parsed):
+    addresses = [
+        item[0][1] if isinstance(item[0], tuple) else item[1]
+        for _,items in parsed or []
+        for item in items
+    ]
+    if not addresses:
+        return 0, 0
+
+    return min(addresses), max(addresses) - min(addresses) + 1
+
+
+##  Sidecar index of the MODBUS frames of a capture.
+class Index(object):
+    """ Sidecar index of the MODBUS frames of a capture. """
+
+    ##  Constructor.
+    #   @param  serverPort  MODBUS server TCP port.
+    #   @param  linktype    Link type of the indexed capture.
+    #   @param  entries     List of index entries, in capture order.
+    #   @param  checkpoints List of (position, states) tuples sorted by
+    #                       position, states mapping automata names to their
+    #                       `Automaton.getCheckpoint` before that entry.
+    #   @param  flows       Dict mapping flow identifiers to their (address,
+    #                       port) client and server endpoints.
+    def __init__(self, serverPort, linktype, entries, checkpoints=None, flows=None):
+        self._serverPort  = serverPort
+        self._linktype    = linktype
+        self._entries     = entries
+        self._times       = [_.ts for _ in entries]
+        self._checkpoints = checkpoints or []
+        self._flows       = flows or {}
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __getitem__(self, position):
+        return self._entries[position]
+
+
+    ##  Returns the MODBUS server TCP port of the index.
+    #   @return The MODBUS server TCP port of the index.
+    def getServerPort(self):
+        """ Returns the MODBUS server TCP port of the index. """
+        return self._serverPort
+
+
+    ##  Returns the endpoints of a flow.
+    #   @param  flow    Flow identifier.
+    #   @return A tuple containing the (address, port) client and server
+    #           endpoints or None if the flow is unknown.
+    def getEndpoints(self, flow):
+        """ Returns the endpoints of a flow. """
+        return self._flows.get(flow)
+
+
+    ##  Builds the index of a capture by scanning it once.
+    #   Frames are decoded with the MODBUS handlers so that responses get the
+    #   addresses of their matching requests. A frame is a sync point when no
+    #   request is pending before it, decoding may then safely start there.
+    #   When automata are given, they are fed every frame and their state is
+    #   checkpointed at every `checkpointEvery` sync points. Responses whose
+    #   request precedes the capture are indexed without addresses.
+    #   @param  pcapPath        Input pcap file path.
+    #   @param  serverPort      MODBUS server TCP port.
+    #   @param  automata        List of automata in their start state, or None.
+    #   @param  checkpointEvery Number of sync points between checkpoints.
+    #   @return The index of the capture.
+    @classmethod
+    def build(cls, pcapPath, serverPort, automata=None, checkpointEvery=64):
+        """ Builds the index of a capture by scanning it once. """
+        entries = []
+        checkpoints = []
+        flows = {}
+        nbSync = 0
+        modbus.resetQueues()
+        with CaptureFile(pcapPath) as capture:
+            for offset,ts,data in capture:
+                pkt = capture.toPacket(ts, data)
+                sync = modbus.queuesEmpty()
+                try:
+                    decoded = modbus.decodePacket(pkt, serverPort)
+                except IndexError:
+                    # Response to a request preceding the capture.
+                    sync = False
+                    decoded = int.from_bytes(pkt[scpy.Raw].load[0:2], byteorder="big"), None
+                if decoded is None:
+                    continue
+
+                seqNb,parsed = decoded
+                flags = FLAG_SYNC if sync else 0
+                if automata is not None and sync:
+                    if nbSync % checkpointEvery == 0:
+                        checkpoints.append((len(entries), {
+                            automaton.getName(): automaton.getCheckpoint()
+                            for automaton in automata
+                        }))
+                    nbSync += 1
+
+                msgL = modbus.inputMessages(parsed)
+                for automaton in automata or []:
+                    if msgL:
+                        try:
+                            automaton.update(msgL)
+                        except errors.TransitionError:
+                            pass
+                if pkt[scpy.TCP].sport == serverPort:
+                    flags |= FLAG_RESPONSE
+
+                flow = modbus.flowId(pkt, serverPort)
+                if flow not in flows:
+                    flows[flow] = modbus.flowEndpoints(pkt, serverPort)
+
+                entries.append(IndexEntry(
+                    offset,
+                    ts,
+                    flow,
+                    seqNb,
+                    pkt[scpy.Raw].load[7],
+                    flags,
+                    *_addressRange(parsed)
+                ))
+
+            linktype = capture.linktype
+
+        modbus.resetQueues()
+        return cls(serverPort, linktype, entries, checkpoints, flows)
+
+
+    ##  Loads an index from a sidecar file.
+    #   @param  indexPath   Input index file path.
+    #   @return The loaded index.
+    @classmethod
+    def load(cls, indexPath):
+        """ Loads an index from a sidecar file. """
+        with open(indexPath, "rb") as handle:
+            magic,version,serverPort,linktype,nbEntries = HEADER.unpack(
+                handle.read(HEADER.size)
+            )
+            if magic != MAGIC or version not in (1, VERSION):
+                raise errors.CaptureError("Unsupported index file: {}".format(indexPath))
+
+            data = handle.read(nbEntries * ENTRY.size)
+            trailer = {}
+            if version >= 2:
+                size = handle.read(TRAILER.size)
+                raw = handle.read(TRAILER.unpack(size)[0]) if len(size) == TRAILER.size else b""
+                if len(size) != TRAILER.size or len(raw) != TRAILER.unpack(size)[0]:
+                    raise errors.CaptureError("Truncated index file: {}".format(indexPath))
+                trailer = json.loads(raw.decode())
+
+        if len(data) != nbEntries * ENTRY.size:
+            raise errors.CaptureError("Truncated index file: {}".format(indexPath))
+
+        checkpoints = [
+            (position, {
+                name: (current, {(dtype, addr): value for dtype,addr,value in values})
+                for name,(current,values) in states.items()
+            })
+            for position,states in trailer.get("checkpoints", [])
+        ]
+        return cls(
+            serverPort,
+            linktype,
+            list(map(IndexEntry._make, ENTRY.iter_unpack(data))),
+            checkpoints,
+            {_[0]: (tuple(_[1:3]), tuple(_[3:5])) for _ in trailer.get("flows", [])}
+        )
+
+
+    ##  Writes the index to a sidecar file.
+    #   @param  indexPath   Output index file path.
+    def save(self, indexPath):
+        """ Writes the index to a sidecar file. """
+        with open(indexPath, "wb") as handle:
+            handle.write(HEADER.pack(
+                MAGIC,
+                VERSION,
+                self._serverPort,
+                self._linktype,
+                len(self._entries)
+            ))
+            for entry in self._entries:
+                handle.write(ENTRY.pack(*entry))
+
+            trailer = json.dumps({"checkpoints": [
+                (position, {
+                    name: (current, [(dtype, addr, value) for (dtype,addr),value in values.items()])
+                    for name,(current,values) in states.items()
+                })
+                for position,states in self._checkpoints
+            ], "flows": [
+                (flow,) + client + server
+                for flow,(client,server) in sorted(self._flows.items())
+            ]}).encode()
+            handle.write(TRAILER.pack(len(trailer)))
+            handle.write(trailer)
+
+
+    ##  Returns the positions of the entries matching some criteria.
+    #   Time bounds are looked up by bisection and thus assume a capture in
+    #   chronological order.
+    #   @param  flow        Flow identifier or None for any.
+    #   @param  fnCodes     Collection of function codes or None for any.
+    #   @param  addresses   Tuple of first and last touched addresses or None
+    #                       for any.
+    #   @param  start       Lower timestamp bound or None.
+    #   @param  end         Upper timestamp bound or None.
+    #   @param  server      Server address (e.g. the IP of one PLC) or None
+    #                       for any.
+    #   @return The sorted list of matching positions.
+    def select(self, flow=None, fnCodes=None, addresses=None, start=None, end=None,
+               server=None):
+        """ Returns the positions of the entries matching some criteria. """
+        lo = 0 if start is None else bisect.bisect_left(self._times, start)
+        hi = len(self._entries) if end is None else bisect.bisect_right(self._times, end)
+        flows = None
+        if server is not None:
+            flows = {k for k,(_,(address,_)) in self._flows.items() if address == server}
+
+        return [
+            position for position in range(lo, hi)
+            if self._matches(self._entries[position], flow, fnCodes, addresses, flows)
+        ]
+
+
+    @staticmethod
+    def _matches(entry, flow, fnCodes, addresses, flows=None):
+        if flow is not None and entry.flow != flow:
+            return False
+        if flows is not None and entry.flow not in flows:
+            return False
+        if fnCodes is not None and entry.fnCode not in fnCodes:
+            return False
+        if addresses is not None:
+            first,last = addresses
+            if not entry.nbAddr or entry.first > last or entry.first + entry.nbAddr - 1 < first:
+                return False
+
+        return True
+
+
+    ##  Returns the nearest automata checkpoint at or before a position.
+    #   @param  position    Position of an entry.
+    #   @return A tuple containing the position of the checkpoint and the
+    #           states of the automata, or None if there is none.
+    def checkpoint(self, position):
+        """ Returns the nearest automata checkpoint at or before a position. """
+        i = bisect.bisect_right([_[0] for _ in self._checkpoints], position)
+        return self._checkpoints[i - 1] if i else None
+
+
+    ##  Returns the nearest sync point at or before a position.
+    #   @param  position    Position of an entry.
+    #   @return The position of the sync point.
+    def syncPoint(self, position):
+        """ Returns the nearest sync point at or before a position. """
+        while position > 0 and not self._entries[position].flags & FLAG_SYNC:
+            position -= 1
+
+        return position
+
+
+##  Analyzes the frames of a capture matching some criteria using its index.
+#   Automata enter the first matching frame in the state a full pass would
+#   leave them in: they are restored from the nearest checkpoint of the index
+#   (or taken in their start state from the beginning of the capture if there
+#   is none) and every frame from there to the first matching one is given to
+#   `seedCallback`, which should update them without reporting. Without
+#   automata, decoding only starts from the preceding sync point so that
+#   responses are matched with their requests.
+#   @param  pcapPath        Input pcap file path.
+#   @param  index           Index of the capture.
+#   @param  callback        Called as `callback(seqNb, parsed)` on matching
+#                           frames.
+#   @param  seedCallback    Called as `seedCallback(seqNb, parsed)` on seeding
+#                           frames, or None.
+#   @param  automata        Automata updated by the callbacks, in their start
+#                           state, or None.
+#   @param  flow            Flow identifier or None for any.
+#   @param  fnCodes         Collection of function codes or None for any.
+#   @param  addresses       Tuple of first and last touched addresses or None.
+#   @param  start           Lower timestamp bound or None.
+#   @param  end             Upper timestamp bound or None.
+#   @param  server          Server address or None for any.
+#   @return The number of frames given to `callback`.
+def analyze(pcapPath, index, callback, seedCallback=None, automata=None,
+            flow=None, fnCodes=None, addresses=None, start=None, end=None,
+            server=None):
+    """ Analyzes the frames of a capture matching some criteria using its index. """
+    matching = index.select(flow, fnCodes, addresses, start, end, server)
+    if not matching:
+        return 0
+
+    first = index.syncPoint(matching[0])
+    if automata is not None:
+        checkpoint = index.checkpoint(matching[0])
+        first = 0
+        if checkpoint is not None:
+            first,states = checkpoint
+            for automaton in automata:
+                if automaton.getName() in states:
+                    automaton.restore(states[automaton.getName()])
+
+    serverPort = index.getServerPort()
+    modbus.resetQueues()
+    with CaptureFile(pcapPath) as capture:
+        for positions,handler in ((range(first, matching[0]), seedCallback), (matching, callback)):
+            for position in positions:
+                pkt = capture.toPacket(*capture.readAt(index[position].offset))
+                try:
+                    decoded = modbus.decodePacket(pkt, serverPort)
+                except IndexError:
+                    # Response to a request preceding the capture.
+                    continue
+                if decoded is not None and handler is not None:
+                    handler(*decoded)
+
+    modbus.resetQueues()
+    return len(matching)
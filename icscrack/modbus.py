@@ -26,9 +26,19 @@
 #   IN THE SOFTWARE.
 
 
+import sys
+import threading
+import time
+import zlib
+from array import array
+
 import scapy.all as scpy
 
 
+from . import errors
+from .events import EventBatch, INPUT_KINDS
+
+
 READ_QUEUE = {
     "Coil": [],
     "DiscreteInput": [],
@@ -44,26 +54,233 @@ WRITE_QUEUE = {
 }
 
 
-def modbusHandler(serverPort, callback):
+##  Returns the client and server endpoints of the TCP flow of a packet.
+#   @param  pkt         Scapy packet.
+#   @param  serverPort  MODBUS server TCP port.
+#   @return A tuple containing the (address, port) client and server
+#           endpoints.
+def flowEndpoints(pkt, serverPort):
+    """ Returns the client and server endpoints of the TCP flow of a packet. """
+    ip = pkt.getlayer(scpy.IP) or pkt.getlayer(scpy.IPv6)
+    tcp = pkt[scpy.TCP]
+    if tcp.dport == serverPort:
+        return (ip.src, tcp.sport), (ip.dst, tcp.dport)
+
+    return (ip.dst, tcp.dport), (ip.src, tcp.sport)
+
+
+##  Returns a stable identifier of the TCP flow a packet belongs to.
+#   The identifier only depends on the client and server endpoints so that
+#   requests and responses of a same connection share it.
+#   @param  pkt         Scapy packet.
+#   @param  serverPort  MODBUS server TCP port.
+#   @return A 32 bits flow identifier.
+def flowId(pkt, serverPort):
+    """ Returns a stable identifier of the TCP flow a packet belongs to. """
+    client,server = flowEndpoints(pkt, serverPort)
+    return zlib.crc32("{}:{}>{}:{}".format(*(client + server)).encode())
+
+
+##  Decodes a MODBUS packet.
+#   @param  pkt         Scapy packet.
+#   @param  serverPort  MODBUS server TCP port.
+#   @param  batch       Event batch to append the packet to, or None.
+#   @return A tuple containing the MODBUS transaction identifier and either
+#           the list of parsed requests or responses or `batch` if given, or
+#           None if the packet is not a MODBUS packet.
+def decodePacket(pkt, serverPort, batch=None):
+    """ Decodes a MODBUS packet. """
+    if scpy.TCP in pkt and scpy.Raw in pkt:
+        modbusPkt = pkt[scpy.Raw].load
+        seqNb = int.from_bytes(modbusPkt[0:2], byteorder="big")
+        fnCode = modbusPkt[7]
+        payload = modbusPkt[8:]
+
+        if pkt[scpy.TCP].dport == serverPort:
+            handle = handleRequest
+        elif pkt[scpy.TCP].sport == serverPort:
+            handle = handleResponse
+        else:
+            return None
+
+        if batch is None:
+            return seqNb, handle(fnCode, payload)
+
+        batch.beginPacket(seqNb, flowId(pkt, serverPort), float(pkt.time))
+        handle(fnCode, payload, batch)
+        batch.dropEmptyPacket()
+        return seqNb, batch
+
+    return None
+
+
+##  Returns the input messages of a parsed packet, as given to
+#   `Automaton.update`.
+#   @param  parsed  List of parsed requests or responses.
+#   @return A dict mapping variables mappings to their read or written values.
+def inputMessages(parsed):
+    """ Returns the input messages of a parsed packet. """
+    return {
+        item[0]: item[1]
+        for kind,items in parsed or []
+        if kind in INPUT_KINDS
+        for item in items
+        if isinstance(item[0], tuple)
+    }
+
+
+##  Empties the pending requests queues.
+#   Must be called before decoding a capture from somewhere else than its
+#   start, responses would otherwise be matched with stale requests.
+def resetQueues():
+    """ Empties the pending requests queues. """
+    for queue in (READ_QUEUE, WRITE_QUEUE):
+        for pending in queue.values():
+            del pending[:]
+
+
+##  Returns whether no request is waiting for its response.
+#   @return True if both requests queues are empty.
+def queuesEmpty():
+    """ Returns whether no request is waiting for its response. """
+    return not any(READ_QUEUE.values()) and not any(WRITE_QUEUE.values())
+
+
+##  Returns a MODBUS handler to give as `prn` to scapy's `sniff`.
+#   @param  serverPort  MODBUS server TCP port.
+#   @param  callback    Called as `callback(seqNb, parsed)` on each packet.
+#   @param  recorder    `EvidenceRecorder` keeping raw frames, triggered when
+#                       `callback` raises a `TransitionError`, or None.
+#   @return The MODBUS handler.
+def modbusHandler(serverPort, callback, recorder=None):
     def handler(pkt):
-        if scpy.TCP in pkt and scpy.Raw in pkt:
-            modbusPkt = pkt[scpy.Raw].load
-            seqNb = int.from_bytes(modbusPkt[0:2], byteorder="big")
-            fnCode = modbusPkt[7]
-            payload = modbusPkt[8:]
-
-            parsed = []
+        if recorder is not None:
+            recorder.record(pkt)
+
+        decoded = decodePacket(pkt, serverPort)
+        if decoded is not None:
+            try:
+                callback(*decoded)
+            except errors.TransitionError:
+                if recorder is not None:
+                    recorder.trigger(flowId(pkt, serverPort))
+                raise
 
-            if pkt[scpy.TCP].dport == serverPort:
-                parsed = handleRequest(fnCode, payload)
-            elif pkt[scpy.TCP].sport == serverPort:
-                parsed = handleResponse(fnCode, payload)
-            else:
-                return
+    return handler
 
-            callback(seqNb, parsed)
 
-    return handler
+##  MODBUS handler delivering the events of many packets at once.
+#   Instances are meant to be given as `prn` to scapy's `sniff`, `callback`
+#   is called with an `EventBatch` every `batchSize` packets.
+class BatchHandler(object):
+    """ MODBUS handler delivering the events of many packets at once. """
+
+    ##  Constructor.
+    #   @param  serverPort  MODBUS server TCP port.
+    #   @param  callback    Called as `callback(batch)`, the batch is reused
+    #                       once the callback returns.
+    #   @param  batchSize   Number of packets per batch.
+    #   @param  maxLatency  Maximum age in seconds of the oldest pending packet,
+    #                       checked against the timestamp of every handled
+    #                       packet, MODBUS or not, and against the wall clock
+    #                       by `flushLate` (None waits for full batches).
+    def __init__(self, serverPort, callback, batchSize=64, maxLatency=None):
+        self._serverPort = serverPort
+        self._callback   = callback
+        self._batchSize  = batchSize
+        self._maxLatency = maxLatency
+        self._batch      = EventBatch()
+        self._since      = None
+        self._lock       = threading.Lock()
+
+
+    ##  Decodes a packet into the current batch.
+    #   @param  pkt Scapy packet.
+    def __call__(self, pkt):
+        with self._lock:
+            decodePacket(pkt, self._serverPort, self._batch)
+            if self._batch.nbPackets() and self._since is None:
+                self._since = time.monotonic()
+
+            if self._batch.nbPackets() >= self._batchSize:
+                self._flush()
+            elif (self._maxLatency is not None and self._batch.nbPackets()
+                    and float(pkt.time) - self._batch.times[0] >= self._maxLatency):
+                self._flush()
+
+
+    ##  Delivers the pending packets, if any.
+    def flush(self):
+        """ Delivers the pending packets, if any. """
+        with self._lock:
+            self._flush()
+
+
+    ##  Delivers the pending packets if the oldest one was decoded at least
+    #   `maxLatency` seconds ago, meant to be called periodically from another
+    #   thread so that latency is bounded on quiet links.
+    def flushLate(self):
+        """ Delivers the pending packets if the oldest one waits for too long. """
+        with self._lock:
+            if (self._maxLatency is not None and self._since is not None
+                    and time.monotonic() - self._since >= self._maxLatency):
+                self._flush()
+
+
+    def _flush(self):
+        if self._batch.nbPackets():
+            self._callback(self._batch)
+            self._batch.clear()
+        self._since = None
+
+
+##  Returns the events of a handler in the requested format.
+#   @param  kind        Kind of the events (ReadReq, ReadResp, ...).
+#   @param  dtype       Data type of the events (Coil, HoldingRegister, ...).
+#   @param  addresses   Addresses of the events.
+#   @param  values      Values of the events or None.
+#   @param  batch       Event batch to append events to, or None.
+#   @return `batch` if given, a list of parsed requests or responses otherwise.
+def _emit(kind, dtype, addresses, values, batch):
+    if batch is not None:
+        batch.extend(kind, dtype, addresses, values)
+        return batch
+
+    if values is None:
+        return [(kind, [(dtype, addr) for addr in addresses])]
+
+    return [(kind, [((dtype, addr), value) for addr,value in zip(addresses, values)])]
+
+
+##  Pops every pending request of a queue.
+#   @param  queue   Requests queue.
+#   @return The list of popped requests.
+def _popAll(queue):
+    res = queue[:]
+    del queue[:]
+    return res
+
+
+##  Unpacks bits values, least significant bit first.
+#   @param  data    Packed bits.
+#   @param  nb      Number of bits to unpack.
+#   @return The list of unpacked bits as booleans.
+def _bits(data, nb):
+    bits = int.from_bytes(data, byteorder="big")
+    return [bool(bits >> i & 0x1) for i in range(nb)]
+
+
+##  Unpacks big endian 16 bits registers values.
+#   @param  data    Packed registers, missing ones are read as zeros.
+#   @param  nb      Number of registers to unpack.
+#   @return The array of unpacked registers.
+def _registers(data, nb):
+    data = bytes(data[:2*nb])
+    res = array("H", data + bytes(2*nb - len(data)))
+    if sys.byteorder == "little":
+        res.byteswap()
+
+    return res
 
 
 ##  Handles a MODBUS request of multiple coils reading (fn code 1).
@@ -71,18 +288,19 @@ def modbusHandler(serverPort, callback):
 #   @param  payload Request payloads containing:
 #                       * `fisrt`: Address of first coil to read (2 bytes)
 #                       * `nbAddr`: Number of coils to read (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadReq)
 #               * Type of the data (here Coil)
 #               * Address requested.
-def handleReqReadMultCO(payload):
+def handleReqReadMultCO(payload, batch=None):
     """ Handles a MODBUS request of multiple coils reading (fn code 1). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
     addresses = range(first, first+nbAddr)
 
     READ_QUEUE["Coil"] += addresses
-    return [("ReadReq", [("Coil", addr) for addr in addresses])]
+    return _emit("ReadReq", "Coil", addresses, None, batch)
 
 
 ##  Handles a MODBUS response of multiple coils reading (fn code 1).
@@ -90,25 +308,17 @@ def handleReqReadMultCO(payload):
 #   @param  payload Response payloads containing:
 #                       * Number of bytes of coil values to follow (1 byte)
 #                       * Coil values (8 coils per byte)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadResp)
 #               * Type of the data (here Coil)
 #               * Address requested.
 #               * Value returned.
-def handleRespReadMultCO(payload):
+def handleRespReadMultCO(payload, batch=None):
     """ Handles a MODBUS response of multiple coils reading (fn code 1). """
-    bits = int.from_bytes(payload[1:], byteorder="big")
-    tmp = []
-    while True:
-        try:
-            req = READ_QUEUE["Coil"].pop(0)
-            bit = bool(bits & 0x1)
-            bits >>= 1
-            tmp += [(("Coil", req), bit)]
-        except IndexError:
-            break
-
-    return [("ReadResp", tmp)]
+    addresses = _popAll(READ_QUEUE["Coil"])
+    values = _bits(payload[1:], len(addresses))
+    return _emit("ReadResp", "Coil", addresses, values, batch)
 
 
 ##  Handles a MODBUS request of multiple discrete inputs reading (fn code 2).
@@ -116,18 +326,19 @@ def handleRespReadMultCO(payload):
 #   @param  payload Request payloads containing:
 #                       * `fisrt`: Address of first discrete input to read (2 bytes)
 #                       * `nbAddr`: Number of discrete inputs to read (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadReq)
 #               * Type of the data (here DiscreteInput)
 #               * Address requested.
-def handleReqReadMultDI(payload):
+def handleReqReadMultDI(payload, batch=None):
     """ Handles a MODBUS request of multiple discrete inputs reading (fn code 2). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
     addresses = range(first, first+nbAddr)
 
     READ_QUEUE["DiscreteInput"] += addresses
-    return [("ReadReq", [("DiscreteInput", addr) for addr in addresses])]
+    return _emit("ReadReq", "DiscreteInput", addresses, None, batch)
 
 
 ##  Handles a MODBUS response of multiple discrete inputs reading (fn code 2).
@@ -135,25 +346,17 @@ def handleReqReadMultDI(payload):
 #   @param  payload Response payloads containing:
 #                       * Number of bytes of discrete input values to follow (1 byte)
 #                       * Discrete input values (8 discrete inputs per byte)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadResp)
 #               * Type of the data (here DiscreteInput)
 #               * Address requested.
 #               * Value returned.
-def handleRespReadMultDI(payload):
+def handleRespReadMultDI(payload, batch=None):
     """ Handles a MODBUS response of multiple discrete inputs reading (fn code 2). """
-    bits = int.from_bytes(payload[1:], byteorder="big")
-    tmp = []
-    while True:
-        try:
-            req = READ_QUEUE["DiscreteInput"].pop(0)
-            bit = bool(bits & 0x1)
-            bits >>= 1
-            tmp += [(("DiscreteInput", req), bit)]
-        except IndexError:
-            break
-
-    return [("ReadResp", tmp)]
+    addresses = _popAll(READ_QUEUE["DiscreteInput"])
+    values = _bits(payload[1:], len(addresses))
+    return _emit("ReadResp", "DiscreteInput", addresses, values, batch)
 
 
 ##  Handles a MODBUS request of multiple holding registers reading (fn code 3).
@@ -161,18 +364,19 @@ def handleRespReadMultDI(payload):
 #   @param  payload Request payloads containing:
 #                       * `fisrt`: Address of first holding register to read (2 bytes)
 #                       * `nbAddr`: Number of holding registers to read (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadReq)
 #               * Type of the data (here HoldingRegister)
 #               * Address requested.
-def handleReqReadMultHR(payload):
+def handleReqReadMultHR(payload, batch=None):
     """ Handles a MODBUS request of multiple holding registers reading (fn code 3). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
     addresses = range(first, first+nbAddr)
 
     READ_QUEUE["HoldingRegister"] += addresses
-    return [("ReadReq", [("HoldingRegister", addr) for addr in addresses])]
+    return _emit("ReadReq", "HoldingRegister", addresses, None, batch)
 
 
 ##  Handles a MODBUS response of multiple holding registers reading (fn code 3).
@@ -180,25 +384,17 @@ def handleReqReadMultHR(payload):
 #   @param  payload Response payloads containing:
 #                       * Number of bytes of holding register values to follow (1 byte)
 #                       * Holding registers values (2 bytes each)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadResp)
 #               * Type of the data (here HoldingRegister)
 #               * Address requested.
 #               * Value returned.
-def handleRespReadMultHR(payload):
+def handleRespReadMultHR(payload, batch=None):
     """ Handles a MODBUS response of multiple holding registers reading (fn code 3). """
-    values = payload[1:]
-    tmp = []
-    while True:
-        try:
-            req = READ_QUEUE["HoldingRegister"].pop(0)
-            value = int.from_bytes(values[:2], byteorder="big")
-            values = values[2:]
-            tmp += [(("HoldingRegister", req), value)]
-        except IndexError:
-            break
-
-    return [("ReadResp", tmp)]
+    addresses = _popAll(READ_QUEUE["HoldingRegister"])
+    values = _registers(payload[1:], len(addresses))
+    return _emit("ReadResp", "HoldingRegister", addresses, values, batch)
 
 
 ##  Handles a MODBUS request of multiple input registers reading (fn code 4).
@@ -206,18 +402,19 @@ def handleRespReadMultHR(payload):
 #   @param  payload Request payloads containing:
 #                       * `fisrt`: Address of first input register to read (2 bytes)
 #                       * `nbAddr`: Number of input registers to read (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadReq)
 #               * Type of the data (here InputRegister)
 #               * Address requested.
-def handleReqReadMultIR(payload):
+def handleReqReadMultIR(payload, batch=None):
     """ Handles a MODBUS request of multiple input registers reading (fn code 4). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
     addresses = range(first, first+nbAddr)
 
     READ_QUEUE["InputRegister"] += addresses
-    return [("ReadReq", [("InputRegister", addr) for addr in addresses])]
+    return _emit("ReadReq", "InputRegister", addresses, None, batch)
 
 
 ##  Handles a MODBUS response of multiple input registers reading (fn code 4).
@@ -225,25 +422,17 @@ def handleReqReadMultIR(payload):
 #   @param  payload Response payloads containing:
 #                       * Number of bytes of input register values to follow (1 byte)
 #                       * Input registers values (2 bytes each)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here ReadResp)
 #               * Type of the data (here InputRegister)
 #               * Address requested.
 #               * Value returned.
-def handleRespReadMultIR(payload):
+def handleRespReadMultIR(payload, batch=None):
     """ Handles a MODBUS response of multiple input registers reading (fn code 4). """
-    values = payload[1:]
-    tmp = []
-    while True:
-        try:
-            req = READ_QUEUE["InputRegister"].pop(0)
-            value = int.from_bytes(values[:2], byteorder="big")
-            values = values[2:]
-            tmp += [(("InputRegister", req), value)]
-        except IndexError:
-            break
-
-    return [("ReadResp", tmp)]
+    addresses = _popAll(READ_QUEUE["InputRegister"])
+    values = _registers(payload[1:], len(addresses))
+    return _emit("ReadResp", "InputRegister", addresses, values, batch)
 
 
 ##  Handles a MODBUS request of single coil writing (fn code 5).
@@ -251,18 +440,19 @@ def handleRespReadMultIR(payload):
 #   @param  payload Request payload containing:
 #                       * `addr`: Address of coil to write (2 bytes)
 #                       * `value`: Value to write into `addr` (2 bytes, normaly 0x0000 or 0xff00)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here WriteReq)
 #               * Type of the data (here Coil)
 #               * Address requested.
 #               * Value to write.
-def handleReqWriteSingCO(payload):
+def handleReqWriteSingCO(payload, batch=None):
     """ Handles a MODBUS request of single coil writing (fn code 5). """
     addr = int.from_bytes(payload[:2], byteorder="big")
     value = bool(int.from_bytes(payload[2:4], byteorder="big"))
 
     WRITE_QUEUE["Coil"] += [(addr, value)]
-    return [("WriteReq", [(("Coil", addr), value)])]
+    return _emit("WriteReq", "Coil", [addr], [value], batch)
 
 
 ##  Handles a MODBUS response of single coil writing (fn code 5).
@@ -270,18 +460,19 @@ def handleReqWriteSingCO(payload):
 #   @param  payload Response payload containing:
 #                       * `addr`: Address of coil to write (2 bytes)
 #                       * `value`: Value written `addr` (2 bytes, normaly 0x0000 or 0xff00)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A tuples containing:
 #               * Type of the request (here WriteResp)
 #               * Type of the data (here Coil)
 #               * Address requested.
 #               * Value written.
-def handleRespWriteSingCO(payload):
+def handleRespWriteSingCO(payload, batch=None):
     """ Handles a MODBUS response of single coil writing (fn code 5). """
     addr = int.from_bytes(payload[:2], byteorder="big")
     value = bool(int.from_bytes(payload[2:4], byteorder="big"))
 
     WRITE_QUEUE["Coil"].pop(0)
-    return [("WriteResp", [(("Coil", addr), value)])]
+    return _emit("WriteResp", "Coil", [addr], [value], batch)
 
 
 ##  Handles a MODBUS request of multiple coils writing (fn code 15).
@@ -291,25 +482,21 @@ def handleRespWriteSingCO(payload):
 #                       * `nbAddr`: Number of coils to force/write (2 bytes)
 #                       * `nbBytes`: Number of bytes of coil values to follow (1 byte)
 #                       * `bits`: Coil values (8 coils per byte)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here WriteReq)
 #               * Type of the data (here Coil)
 #               * Address requested.
 #               * Value to write.
-def handleReqWriteMultCO(payload):
+def handleReqWriteMultCO(payload, batch=None):
     """ Handles a MODBUS request of multiple coils writing (fn code 15). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
-    bits = int.from_bytes(payload[5:], byteorder="big")
-
-    res = []
-    for addr in range(first, first+nbAddr):
-        bit = False if bits & 0x1 == 0 else True
-        bits >>= 1
-        res += [(addr, bit)]
+    addresses = range(first, first+nbAddr)
+    values = _bits(payload[5:], nbAddr)
 
-    WRITE_QUEUE["Coil"] += res
-    return [("WriteReq", [(("Coil", addr), bit) for addr,bit in res])]
+    WRITE_QUEUE["Coil"] += zip(addresses, values)
+    return _emit("WriteReq", "Coil", addresses, values, batch)
 
 
 ##  Handles a MODBUS response of multiple coils writing (fn code 15).
@@ -317,11 +504,12 @@ def handleReqWriteMultCO(payload):
 #   @param  payload Request payloads containing:
 #                       * `addr`: Address of the first coil to write (2 bytes)
 #                       * `nbAddr`: Number of coils to force/write (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here WriteResp)
 #               * Type of the data (here Coil)
 #               * Address requested.
-def handleRespWriteMultCO(payload):
+def handleRespWriteMultCO(payload, batch=None):
     """ Handles a MODBUS response of multiple coils writing (fn code 15). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
@@ -330,7 +518,7 @@ def handleRespWriteMultCO(payload):
     for _ in addresses:
         WRITE_QUEUE["Coil"].pop(0)
 
-    return [("WriteResp", [("Coil", addr) for addr in addresses])]
+    return _emit("WriteResp", "Coil", addresses, None, batch)
 
 
 ##  Handles a MODBUS request of single holding register writing (fn code 6).
@@ -338,18 +526,19 @@ def handleRespWriteMultCO(payload):
 #   @param  payload Request payload containing:
 #                       * `addr`: Address of holding register to write (2 bytes)
 #                       * `value`: Value to write into `addr` (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here WriteReq)
 #               * Type of the data (here HoldingRegister)
 #               * Address requested.
 #               * Value to write.
-def handleReqWriteSingHR(payload):
+def handleReqWriteSingHR(payload, batch=None):
     """ Handles a MODBUS request of single holding register writing (fn code 6). """
     addr = int.from_bytes(payload[:2], byteorder="big")
     value = int.from_bytes(payload[2:4], byteorder="big")
 
     WRITE_QUEUE["HoldingRegister"] += [(addr, value)]
-    return [("WriteReq", [(("HoldingRegister", addr), value)])]
+    return _emit("WriteReq", "HoldingRegister", [addr], [value], batch)
 
 
 ##  Handles a MODBUS response of single holding register writing (fn code 6).
@@ -357,18 +546,19 @@ def handleReqWriteSingHR(payload):
 #   @param  payload Response payload containing:
 #                       * `addr`: Address of holding register to write (2 bytes)
 #                       * `value`: Value written `addr` (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A tuples containing:
 #               * Type of the request (here WriteResp)
 #               * Type of the data (here HoldingRegister)
 #               * Address requested.
 #               * Value written.
-def handleRespWriteSingHR(payload):
+def handleRespWriteSingHR(payload, batch=None):
     """ Handles a MODBUS response of single holding register writing (fn code 6). """
     addr = int.from_bytes(payload[:2], byteorder="big")
     value = int.from_bytes(payload[2:4], byteorder="big")
 
     WRITE_QUEUE["HoldingRegister"].pop(0)
-    return [("WriteResp", [(("HoldingRegister", addr), value)])]
+    return _emit("WriteResp", "HoldingRegister", [addr], [value], batch)
 
 
 ##  Handles a MODBUS request of multiple holding registers writing (fn code 16).
@@ -378,25 +568,21 @@ def handleRespWriteSingHR(payload):
 #                       * `nbAddr`: Number of holding registers to force/write (2 bytes)
 #                       * `nbBytes`: Number of bytes of holding register values to follow (1 byte)
 #                       * `values`: Holding register values (2 bytes each)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here WriteReq)
 #               * Type of the data (here HoldingRegister)
 #               * Address requested.
 #               * Value to write.
-def handleReqWriteMultHR(payload):
+def handleReqWriteMultHR(payload, batch=None):
     """ Handles a MODBUS request of multiple holding registers writing (fn code 16). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
-    values = payload[5:]
-
-    res = []
-    for addr in range(first, first+nbAddr):
-        value = int.from_bytes(values[:2], byteorder="big")
-        values = values[2:]
-        res += [(addr, value)]
+    addresses = range(first, first+nbAddr)
+    values = _registers(payload[5:], nbAddr)
 
-    WRITE_QUEUE["HoldingRegister"] += res
-    return [("WriteReq", [(("HoldingRegister", addr), value) for addr,value in res])]
+    WRITE_QUEUE["HoldingRegister"] += zip(addresses, values)
+    return _emit("WriteReq", "HoldingRegister", addresses, values, batch)
 
 
 ##  Handles a MODBUS response of multiple holding registers writing (fn code 16).
@@ -404,11 +590,12 @@ def handleReqWriteMultHR(payload):
 #   @param  payload Request payloads containing:
 #                       * `addr`: Address of the first holding register to write (2 bytes)
 #                       * `nbAddr`: Number of holding registers to force/write (2 bytes)
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of `nbAddr` tuples containing:
 #               * Type of the request (here WriteResp)
 #               * Type of the data (here HoldingRegister)
 #               * Address requested.
-def handleRespWriteMultHR(payload):
+def handleRespWriteMultHR(payload, batch=None):
     """ Handles a MODBUS response of multiple holding registers writing (fn code 16). """
     first = int.from_bytes(payload[:2], byteorder="big")
     nbAddr = int.from_bytes(payload[2:4], byteorder="big")
@@ -417,31 +604,32 @@ def handleRespWriteMultHR(payload):
     for _ in addresses:
         WRITE_QUEUE["HoldingRegister"].pop(0)
 
-    return [("WriteResp", [("HoldingRegister", addr) for addr in addresses])]
+    return _emit("WriteResp", "HoldingRegister", addresses, None, batch)
 
 
 ##  Handles a MODBUS request.
 #   @param  fnCode  MODBUS function code.
 #   @param  payload Request payload.
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of parsed requests as tuples.
-def handleRequest(fnCode, payload):
+def handleRequest(fnCode, payload, batch=None):
     """ Handles a MODBUS request. """
     if fnCode == 1:
-        return handleReqReadMultCO(payload)
+        return handleReqReadMultCO(payload, batch)
     elif fnCode == 2:
-        return handleReqReadMultDI(payload)
+        return handleReqReadMultDI(payload, batch)
     elif fnCode == 3:
-        return handleReqReadMultHR(payload)
+        return handleReqReadMultHR(payload, batch)
     elif fnCode == 4:
-        return handleReqReadMultIR(payload)
+        return handleReqReadMultIR(payload, batch)
     elif fnCode == 5:
-        return handleReqWriteSingCO(payload)
+        return handleReqWriteSingCO(payload, batch)
     elif fnCode == 6:
-        return handleReqWriteSingHR(payload)
+        return handleReqWriteSingHR(payload, batch)
     elif fnCode == 15:
-        return handleReqWriteMultCO(payload)
+        return handleReqWriteMultCO(payload, batch)
     elif fnCode == 16:
-        return handleReqWriteMultHR(payload)
+        return handleReqWriteMultHR(payload, batch)
     else:
         pass
 
@@ -449,24 +637,25 @@ def handleRequest(fnCode, payload):
 ##  Handles a MODBUS response.
 #   @param  fnCode  MODBUS function code.
 #   @param  payload Response payload.
+#   @param  batch   Event batch to append events to, or None.
 #   @return A list of parsed response as tuples.
-def handleResponse(fnCode, payload):
+def handleResponse(fnCode, payload, batch=None):
     """ Handles a MODBUS response. """
     if fnCode == 1:
-        return handleRespReadMultCO(payload)
+        return handleRespReadMultCO(payload, batch)
     elif fnCode == 2:
-        return handleRespReadMultDI(payload)
+        return handleRespReadMultDI(payload, batch)
     elif fnCode == 3:
-        return handleRespReadMultHR(payload)
+        return handleRespReadMultHR(payload, batch)
     elif fnCode == 4:
-        return handleRespReadMultIR(payload)
+        return handleRespReadMultIR(payload, batch)
     elif fnCode == 5:
-        return handleRespWriteSingCO(payload)
+        return handleRespWriteSingCO(payload, batch)
     elif fnCode == 6:
-        return handleRespWriteSingHR(payload)
+        return handleRespWriteSingHR(payload, batch)
     elif fnCode == 15:
-        return handleRespWriteMultCO(payload)
+        return handleRespWriteMultCO(payload, batch)
     elif fnCode == 16:
-        return handleRespWriteMultHR(payload)
+        return handleRespWriteMultHR(payload, batch)
     else:
         pass
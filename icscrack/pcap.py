@@ -0,0 +1,159 @@
+""" Pcap files random access for SACADE tool API. """
+
+##  @file   pcap.py
+#   @brief  Pcap files random access for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Pcap files random access for SACADE tool API.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import struct
+
+import scapy.all as scpy
+
+
+from . import errors
+
+
+##  Magic numbers of classic pcap files: byte order and timestamp resolution.
+MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+GLOBAL_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+
+##  Link type of Ethernet frames, used when a layer has no known link type.
+LINKTYPE_ETHERNET = 1
+
+
+##  Returns the link type and raw data of a scapy packet.
+#   @param  pkt Scapy packet.
+#   @return A tuple containing the link type and the raw data of the packet.
+def rawFrame(pkt):
+    """ Returns the link type and raw data of a scapy packet. """
+    linktype = scpy.conf.l2types.layer2num.get(pkt.__class__, LINKTYPE_ETHERNET)
+    return linktype, bytes(pkt)
+
+
+##  Writes frames into a classic pcap file.
+#   @param  path        Output pcap file path.
+#   @param  linktype    Link type of the frames.
+#   @param  frames      Iterable of tuples containing the timestamp and the raw
+#                       data of each frame.
+def writeCapture(path, linktype, frames):
+    """ Writes frames into a classic pcap file. """
+    with open(path, "wb") as handle:
+        handle.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 262144, linktype))
+        for ts,data in frames:
+            sec = int(ts)
+            usec = int(round((ts - sec) * 1e6))
+            if usec >= 1000000:
+                sec,usec = sec + 1,usec - 1000000
+            handle.write(struct.pack("<IIII", sec, usec, len(data), len(data)))
+            handle.write(data)
+
+
+##  Classic pcap file giving the offset of each frame and reading frames at
+#   arbitrary offsets.
+class CaptureFile(object):
+    """ Classic pcap file with random access to frames. """
+
+    ##  Constructor.
+    #   @param  path    Input pcap file path.
+    def __init__(self, path):
+        self._handle = open(path, "rb")
+        header = self._handle.read(GLOBAL_HEADER_SIZE)
+        if len(header) < GLOBAL_HEADER_SIZE or header[:4] not in MAGICS:
+            self._handle.close()
+            raise errors.CaptureError("Classic pcap file expected: {}".format(path))
+
+        order,self._resolution = MAGICS[header[:4]]
+        self._record = struct.Struct(order + "IIII")
+        self.linktype = struct.unpack(order + "I", header[20:24])[0]
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    ##  Iterates over the frames of the file.
+    #   @return A generator of tuples containing the offset, the timestamp and
+    #           the raw data of each frame.
+    def __iter__(self):
+        self._handle.seek(GLOBAL_HEADER_SIZE)
+        while True:
+            offset = self._handle.tell()
+            frame = self._readFrame()
+            if frame is None:
+                break
+
+            yield (offset,) + frame
+
+
+    def _readFrame(self):
+        header = self._handle.read(RECORD_HEADER_SIZE)
+        if len(header) < RECORD_HEADER_SIZE:
+            return None
+
+        sec,frac,capLen,_ = self._record.unpack(header)
+        data = self._handle.read(capLen)
+        if len(data) < capLen:
+            return None
+
+        return sec + frac * self._resolution, data
+
+
+    ##  Reads the frame at a given offset.
+    #   @param  offset  Offset of the frame record header in the file.
+    #   @return A tuple containing the timestamp and the raw data of the frame.
+    def readAt(self, offset):
+        """ Reads the frame at a given offset. """
+        self._handle.seek(offset)
+        frame = self._readFrame()
+        if frame is None:
+            raise errors.CaptureError("Truncated frame at offset {}".format(offset))
+
+        return frame
+
+
+    ##  Dissects a raw frame of the file.
+    #   @param  ts      Timestamp of the frame.
+    #   @param  data    Raw data of the frame.
+    #   @return The scapy packet of the frame.
+    def toPacket(self, ts, data):
+        """ Dissects a raw frame of the file. """
+        pkt = scpy.conf.l2types.get(self.linktype, scpy.conf.raw_layer)(data)
+        pkt.time = ts
+        return pkt
+
+
+    ##  Closes the file.
+    def close(self):
+        """ Closes the file. """
+        self._handle.close()
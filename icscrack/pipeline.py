@@ -0,0 +1,503 @@
+""" Multi-processes live pipeline for SACADE tool API. """
+
+##  @file   pipeline.py
+#   @brief  Multi-processes live pipeline for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Multi-processes live pipeline for SACADE tool API.
+#   The capture process only decodes MODBUS packets and writes fixed-size
+#   event records into shared memory ring buffers, one per evaluator process.
+#   Evaluator processes rebuild the parsed packets and feed their automata.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import collections
+import struct
+import time
+import zlib
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+
+from . import errors
+from .core import fromYaml, reloadYaml
+from .events import EventBatch, KINDS, TYPES, NO_VALUE
+from .modbus import decodePacket, flowEndpoints
+
+
+##  Ring header: head, tail, dropped packets, dropped events, deviations,
+#   closed, reload generation, evaluator exited.
+HEADER = struct.Struct("<QQQQQQQQ")
+HEADER_SIZE = 64
+
+##  Event record: kind, data type, flags, address, value, transaction id, flow
+#   (or partition key), timestamp.
+RECORD = struct.Struct("<BBBxHHHxxId")
+
+FLAG_VALUE = 0x1
+FLAG_LAST = 0x2
+
+POLL_INTERVAL = 0.001
+
+
+##  Encodes a packet of an event batch into event records.
+#   @param  batch   Event batch.
+#   @param  i       Index of the packet in the batch.
+#   @param  keep    Set of (data type index, address) to keep or None to keep
+#                   them all.
+#   @param  key     Partition key written instead of the flow identifier, or
+#                   None.
+#   @return The list of record fields lists of the packet.
+def encodeEvents(batch, i, keep=None, key=None):
+    """ Encodes a packet of an event batch into event records. """
+    seqNb,flow,ts,start,stop = batch.packet(i)
+    flow = flow if key is None else key
+    res = []
+    for j in range(start, stop):
+        if keep is not None and (batch.types[j], batch.addresses[j]) not in keep:
+            continue
+
+        value = batch.values[j]
+        if value == NO_VALUE:
+            flags,value = 0,0
+        else:
+            flags = FLAG_VALUE
+
+        res.append([batch.kinds[j], batch.types[j], flags, batch.addresses[j], value, seqNb, flow, ts])
+
+    if res:
+        res[-1][2] |= FLAG_LAST
+
+    return res
+
+
+##  Decodes the event records of a packet.
+#   @param  records List of record fields tuples of the packet.
+#   @return A tuple containing the MODBUS transaction identifier, the flow
+#           identifier, the timestamp and the list of parsed requests or
+#           responses of the packet.
+def decodeEvents(records):
+    """ Decodes the event records of a packet. """
+    parsed = []
+    for kindId,typeId,flags,addr,value,seqNb,flow,ts in records:
+        kind = KINDS[kindId]
+        dtype = TYPES[typeId]
+        if not parsed or parsed[-1][0] != kind:
+            parsed.append((kind, []))
+
+        if flags & FLAG_VALUE:
+            if dtype in ("Coil", "DiscreteInput"):
+                value = bool(value)
+            parsed[-1][1].append(((dtype, addr), value))
+        else:
+            parsed[-1][1].append((dtype, addr))
+
+    return seqNb, flow, ts, parsed
+
+
+##  Single producer single consumer ring buffer of event records in shared
+#   memory.
+class SharedRing(object):
+    """ Single producer single consumer ring buffer of event records in shared memory. """
+
+    ##  @var _shm
+    #   Shared memory segment holding the header and the records.
+    _shm = None
+
+    ##  @var _capacity
+    #   Number of records the ring can hold.
+    _capacity = None
+
+    ##  Constructor.
+    #   @param  capacity    Number of records the ring can hold.
+    #   @param  name        Name of an existing segment to attach to.
+    def __init__(self, capacity, name=None):
+        self._capacity = capacity
+        if name is None:
+            self._shm = shared_memory.SharedMemory(
+                create=True,
+                size=HEADER_SIZE + capacity * RECORD.size
+            )
+            HEADER.pack_into(self._shm.buf, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+
+    def __getstate__(self):
+        return (self._capacity, self._shm.name)
+
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+    def _header(self):
+        return list(HEADER.unpack_from(self._shm.buf, 0))
+
+
+    def _setField(self, index, value):
+        struct.pack_into("<Q", self._shm.buf, index * 8, value)
+
+
+    ##  Writes the records of a packet into the ring.
+    #   Packets are written as a whole or dropped as a whole. Packets are
+    #   always dropped once the evaluator exited, even when blocking.
+    #   @param  records List of record fields tuples of the packet.
+    #   @param  block   Waits for free space rather than dropping the packet.
+    #   @param  timeout Maximum waiting time in seconds (None waits forever).
+    #   @return True if the packet was written, False if dropped.
+    def push(self, records, block=False, timeout=None):
+        """ Writes the records of a packet into the ring. """
+        header = self._header()
+        head,tail,droppedPkts,droppedEvts,dead = header[:4] + header[7:]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while dead or self._capacity - (head - tail) < len(records):
+            if (not block
+                    or dead
+                    or len(records) > self._capacity
+                    or (deadline is not None and time.monotonic() > deadline)):
+                self._setField(2, droppedPkts + 1)
+                self._setField(3, droppedEvts + len(records))
+                return False
+
+            time.sleep(POLL_INTERVAL)
+            header = self._header()
+            tail,dead = header[1],header[7]
+
+        buf = self._shm.buf
+        for i,record in enumerate(records):
+            offset = HEADER_SIZE + ((head + i) % self._capacity) * RECORD.size
+            RECORD.pack_into(buf, offset, *record)
+
+        self._setField(0, head + len(records))
+        return True
+
+
+    ##  Reads the records of the next packet from the ring.
+    #   @return The list of record fields tuples of the packet or None if the
+    #           ring is empty.
+    def pop(self):
+        """ Reads the records of the next packet from the ring. """
+        head,tail = self._header()[:2]
+        buf = self._shm.buf
+        res = []
+        while tail < head:
+            offset = HEADER_SIZE + (tail % self._capacity) * RECORD.size
+            record = RECORD.unpack_from(buf, offset)
+            res.append(record)
+            tail += 1
+            if record[2] & FLAG_LAST:
+                break
+
+        if not res:
+            return None
+
+        self._setField(1, tail)
+        return res
+
+
+    ##  Accounts for a deviation raised by an evaluator.
+    def addDeviation(self):
+        """ Accounts for a deviation raised by an evaluator. """
+        self._setField(4, self._header()[4] + 1)
+
+
+    ##  Marks the ring as closed, evaluators exit once it is drained.
+    def close(self):
+        """ Marks the ring as closed. """
+        self._setField(5, 1)
+
+
+    ##  Asks the evaluator to reload its automata.
+    def requestReload(self):
+        """ Asks the evaluator to reload its automata. """
+        self._setField(6, self._header()[6] + 1)
+
+
+    ##  Returns the number of reloads requested so far.
+    #   @return The reload generation of the ring.
+    def getGeneration(self):
+        """ Returns the number of reloads requested so far. """
+        return self._header()[6]
+
+
+    ##  Marks the evaluator as exited, further packets are dropped.
+    def setDead(self):
+        """ Marks the evaluator as exited. """
+        self._setField(7, 1)
+
+
+    ##  Returns whether the ring is closed and drained.
+    #   @return True if no more records will ever be read from the ring.
+    def isDone(self):
+        """ Returns whether the ring is closed and drained. """
+        head,tail,_,_,_,closed = self._header()[:6]
+        return bool(closed) and head == tail
+
+
+    ##  Returns the ring statistics.
+    #   @return A dict of the pending, dropped and deviations counters and
+    #           whether the evaluator exited.
+    def getStats(self):
+        """ Returns the ring statistics. """
+        header = self._header()
+        head,tail,droppedPkts,droppedEvts,deviations = header[:5]
+        return {
+            "pending": head - tail,
+            "droppedPackets": droppedPkts,
+            "droppedEvents": droppedEvts,
+            "deviations": deviations,
+            "exited": bool(header[7]),
+        }
+
+
+    ##  Releases the shared memory segment.
+    #   @param  unlink  Also destroys the segment (owner only).
+    def release(self, unlink=False):
+        """ Releases the shared memory segment. """
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+##  Returns fresh automata sharing the transitions tables of a template.
+#   @param  template    List of automata.
+#   @return The list of fresh automata.
+def _fromTemplate(template):
+    return [automaton.clone(automaton.getName()) for automaton in template]
+
+
+##  Returns a set of automata following a reloaded template.
+#   Automata whose behavior is unchanged are kept along with their state,
+#   others are replaced by a fresh clone of the template.
+#   @param  automata    Current automata.
+#   @param  template    Reloaded automata.
+#   @return The list of automata following `template`.
+def _followTemplate(automata, template):
+    current = {automaton.getName(): automaton for automaton in automata}
+    res = []
+    for automaton in template:
+        kept = current.get(automaton.getName())
+        if kept is not None and kept.getSource() == automaton.getSource():
+            res.append(kept)
+        else:
+            res.append(automaton.clone(automaton.getName()))
+
+    return res
+
+
+##  Evaluator process main loop.
+#   The ring is marked dead when the loop exits, even on error, so that the
+#   capture process stops waiting for it.
+#   @param  ring            Ring to consume.
+#   @param  yamlPath        Input Yaml file path.
+#   @param  names           Names of the automata to evaluate or None for all.
+#   @param  callbackFactory Returns a `callback(seqNb, parsed)` from a list of
+#                           automata.
+#   @param  perServer       Keeps a distinct set of automata per server.
+#   @param  idleTimeout     Idle time in seconds, on packets timestamps, after
+#                           which the set of automata of a server is dropped.
+def _evaluate(ring, yamlPath, names, callbackFactory, perServer, idleTimeout):
+    try:
+        template = [_ for _ in fromYaml(yamlPath) if names is None or _.getName() in names]
+        generation = ring.getGeneration()
+        automataSets = {}
+        callbacks = {}
+        lastSeen = collections.OrderedDict()
+        while True:
+            if ring.getGeneration() != generation:
+                generation = ring.getGeneration()
+                template = [
+                    _ for _ in reloadYaml(yamlPath, template)
+                    if names is None or _.getName() in names
+                ]
+                for key,automata in automataSets.items():
+                    automataSets[key] = _followTemplate(automata, template) if perServer else template
+                    callbacks[key] = callbackFactory(automataSets[key])
+
+            records = ring.pop()
+            if records is None:
+                if ring.isDone():
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            seqNb,key,ts,parsed = decodeEvents(records)
+            key = key if perServer else None
+            if key not in callbacks:
+                automataSets[key] = _fromTemplate(template) if perServer else template
+                callbacks[key] = callbackFactory(automataSets[key])
+
+            if perServer:
+                lastSeen[key] = ts
+                lastSeen.move_to_end(key)
+                while next(iter(lastSeen.values())) < ts - idleTimeout:
+                    idle,_ = lastSeen.popitem(last=False)
+                    del automataSets[idle]
+                    del callbacks[idle]
+
+            try:
+                callbacks[key](seqNb, parsed)
+            except errors.TransitionError:
+                ring.addDeviation()
+    finally:
+        ring.setDead()
+        ring.release()
+
+
+##  Live pipeline splitting capture and automata evaluation across processes.
+#   Instances are meant to be given as `prn` to scapy's `sniff`.
+class LivePipeline(object):
+    """ Live pipeline splitting capture and automata evaluation across processes. """
+
+    ##  Constructor.
+    #   @param  serverPort      MODBUS server TCP port.
+    #   @param  yamlPath        Input Yaml file path.
+    #   @param  callbackFactory Returns a `callback(seqNb, parsed)` from a list
+    #                           of automata, called in evaluator processes.
+    #   @param  nbWorkers       Number of evaluator processes.
+    #   @param  partition       "automaton" to spread automata across
+    #                           evaluators or "server" to spread servers, each
+    #                           server (address and port) getting its own set
+    #                           of automata fed by all its connections. When
+    #                           spreading automata, packets with inputs are
+    #                           given whole to every evaluator as in a single
+    #                           process run, others only when they touch its
+    #                           automata variables.
+    #   @param  capacity        Number of event records per ring.
+    #   @param  block           Waits for free space rather than dropping.
+    #   @param  timeout         Maximum waiting time in seconds when blocking.
+    #   @param  idleTimeout     Idle time in seconds after which the automata of
+    #                           a server are dropped when spreading servers.
+    def __init__(self, serverPort, yamlPath, callbackFactory, nbWorkers=2,
+                 partition="automaton", capacity=65536, block=False, timeout=None,
+                 idleTimeout=3600.):
+        if partition not in ("automaton", "server"):
+            raise ValueError("Unknown partition: {}".format(partition))
+
+        self._serverPort = serverPort
+        self._block      = block
+        self._timeout    = timeout
+        self._perServer  = partition == "server"
+        self._yamlPath   = yamlPath
+        self._rings      = [SharedRing(capacity) for _ in range(nbWorkers)]
+        self._names      = [None] * nbWorkers
+        self._routes     = [None] * nbWorkers
+        self._automata   = []
+        self._workers    = []
+        self._batch      = EventBatch()
+
+        if not self._perServer:
+            self._automata = fromYaml(yamlPath)
+            self._names = [set() for _ in range(nbWorkers)]
+            for i,automaton in enumerate(self._automata):
+                self._names[i % nbWorkers].add(automaton.getName())
+            self._routes = self._computeRoutes()
+
+        for ring,workerNames in zip(self._rings, self._names):
+            self._workers.append(mp.Process(
+                target=_evaluate,
+                args=(ring, yamlPath, workerNames, callbackFactory, self._perServer, idleTimeout),
+                daemon=True
+            ))
+
+
+    def _computeRoutes(self):
+        routes = [set() for _ in self._names]
+        for automaton in self._automata:
+            for names,route in zip(self._names, routes):
+                if automaton.getName() in names:
+                    route.update(
+                        (TYPES.index(dtype), addr)
+                        for dtype,addr in automaton.getVariables().values()
+                    )
+
+        return routes
+
+
+    ##  Starts the evaluator processes.
+    def start(self):
+        """ Starts the evaluator processes. """
+        for worker in self._workers:
+            worker.start()
+
+
+    ##  Decodes a packet and dispatches its events to the evaluators.
+    #   @param  pkt Scapy packet.
+    def __call__(self, pkt):
+        self._batch.clear()
+        decodePacket(pkt, self._serverPort, self._batch)
+        if not self._batch.nbPackets():
+            return
+
+        if self._perServer:
+            key = zlib.crc32("{}:{}".format(*flowEndpoints(pkt, self._serverPort)[1]).encode())
+            ring = self._rings[key % len(self._rings)]
+            records = encodeEvents(self._batch, 0, key=key)
+            if records:
+                ring.push(records, self._block, self._timeout)
+        else:
+            # Automata update on any input, a guard may fire on stored values
+            # alone: packets with inputs go whole to every evaluator.
+            hasInputs = bool(self._batch.messages(0))
+            for ring,keep in zip(self._rings, self._routes):
+                records = encodeEvents(self._batch, 0, None if hasInputs else keep)
+                if records:
+                    ring.push(records, self._block, self._timeout)
+
+
+    ##  Asks the evaluators to reload the Yaml file.
+    #   Only changed automata are rebuilt, see `reloadYaml`. When spreading
+    #   automata, the registers routed to each evaluator follow the reloaded
+    #   variables, but each process keeps the automata names of the first
+    #   load: agents added since are ignored.
+    def reload(self):
+        """ Asks the evaluators to reload the Yaml file. """
+        if not self._perServer:
+            self._automata = reloadYaml(self._yamlPath, self._automata)
+            self._routes = self._computeRoutes()
+
+        for ring in self._rings:
+            ring.requestReload()
+
+
+    ##  Returns the statistics of each evaluator ring.
+    #   @return A list of dicts of the pending, dropped and deviations counters.
+    def getStats(self):
+        """ Returns the statistics of each evaluator ring. """
+        return [ring.getStats() for ring in self._rings]
+
+
+    ##  Drains the rings, stops the evaluators and releases shared memory.
+    #   @return The final statistics of each evaluator ring.
+    def close(self):
+        """ Drains the rings, stops the evaluators and releases shared memory. """
+        for ring in self._rings:
+            ring.close()
+
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.join()
+
+        stats = self.getStats()
+        for ring in self._rings:
+            ring.release(unlink=True)
+
+        return stats
@@ -0,0 +1,330 @@
+""" Sensors to collectors events transport for SACADE tool API. """
+
+##  @file   transport.py
+#   @brief  Sensors to collectors events transport for SACADE tool API.
+#   @author Maxime Puys
+#   @date   2026-10-19
+#   Sensors to collectors events transport for SACADE tool API.
+#   Sensors decode MODBUS locally and stream compressed event batches over TCP
+#   to collectors owning the automata. Flows are spread over collectors by
+#   consistent hashing and numbered so that collectors detect lost packets.
+#
+#   Copyright (c) 2016 University Grenoble Alpes
+#   Permission is hereby granted, free of charge, to any person obtaining a copy
+#   of this software and associated documentation files (the "Software"), to
+#   deal in the Software without restriction, including without limitation the
+#   rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#   sell copies of the Software, and to permit persons to whom the Software is
+#   furnished to do so, subject to the following conditions:
+#
+#   The above copyright notice and this permission notice shall be included in
+#   all copies or substantial portions of the Software.
+#
+#   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#   FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#   IN THE SOFTWARE.
+
+import bisect
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+
+from . import errors
+from .core import fromYaml, reloadYaml
+from .events import EventBatch
+from .modbus import BatchHandler
+
+
+##  Message header: payload length, sensor identifier.
+HEADER = struct.Struct("<II")
+
+
+##  Consistent hashing ring mapping keys to nodes.
+class HashRing(object):
+    """ Consistent hashing ring mapping keys to nodes. """
+
+    ##  Constructor.
+    #   @param  nodes       List of nodes (any value with a stable `str`).
+    #   @param  replicas    Number of virtual points per node.
+    def __init__(self, nodes, replicas=64):
+        points = sorted(
+            (zlib.crc32("{}#{}".format(node, i).encode()), node)
+            for node in nodes
+            for i in range(replicas)
+        )
+        self._hashes = [_[0] for _ in points]
+        self._nodes  = [_[1] for _ in points]
+
+
+    ##  Returns the node owning a key.
+    #   @param  key Integer key (e.g. a flow identifier).
+    #   @return The node owning `key`.
+    def nodeFor(self, key):
+        """ Returns the node owning a key. """
+        point = zlib.crc32(struct.pack("<I", key))
+        return self._nodes[bisect.bisect(self._hashes, point) % len(self._nodes)]
+
+
+##  Encodes a message of event batch.
+#   @param  sensorId    Identifier of the sending sensor.
+#   @param  flowSeqs    Per-flow sequence number of each packet.
+#   @param  batch       Event batch.
+#   @param  level       Compression level.
+#   @return The encoded message.
+def encodeMessage(sensorId, flowSeqs, batch, level=1):
+    """ Encodes a message of event batch. """
+    flowSeqs = array("Q", flowSeqs)
+    if sys.byteorder == "big":
+        flowSeqs.byteswap()
+
+    payload = zlib.compress(
+        struct.pack("<I", len(flowSeqs)) + flowSeqs.tobytes() + batch.toBytes(),
+        level
+    )
+    return HEADER.pack(len(payload), sensorId) + payload
+
+
+##  Decodes the payload of a message of event batch.
+#   @param  payload Compressed payload of the message.
+#   @return A tuple containing the per-flow sequence numbers of the packets and
+#           the event batch.
+def decodePayload(payload):
+    """ Decodes the payload of a message of event batch. """
+    data = zlib.decompress(payload)
+    nbPackets = struct.unpack_from("<I", data)[0]
+    flowSeqs = array("Q")
+    flowSeqs.frombytes(data[4:4+8*nbPackets])
+    if sys.byteorder == "big":
+        flowSeqs.byteswap()
+
+    return flowSeqs, EventBatch.fromBytes(data[4+8*nbPackets:])
+
+
+##  Reads exactly `size` bytes from a socket.
+#   @param  sock    Socket to read from.
+#   @param  size    Number of bytes to read.
+#   @return The bytes read or None if the connection was closed.
+def _recvExactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+##  Sensor decoding MODBUS locally and streaming events to collectors.
+#   Instances are meant to be given as `prn` to scapy's `sniff`.
+class Sensor(object):
+    """ Sensor decoding MODBUS locally and streaming events to collectors. """
+
+    ##  Constructor.
+    #   @param  serverPort  MODBUS server TCP port.
+    #   @param  collectors  List of (host, port) addresses of the collectors.
+    #   @param  sensorId    Identifier of the sensor.
+    #   @param  batchSize   Number of packets decoded before sending.
+    #   @param  level       Compression level.
+    #   @param  maxLatency  Maximum time in seconds events wait before being
+    #                       sent, measured on packets timestamps and on the
+    #                       wall clock by a background thread.
+    #   @param  timeout     Connection and sending timeout in seconds.
+    #   @param  retryDelay  Time in seconds during which events for a collector
+    #                       that could not be reached are dropped.
+    def __init__(self, serverPort, collectors, sensorId=0, batchSize=64, level=1,
+                 maxLatency=0.5, timeout=1., retryDelay=5.):
+        self._collectors = [tuple(_) for _ in collectors]
+        self._sensorId   = sensorId
+        self._level      = level
+        self._timeout    = timeout
+        self._retryDelay = retryDelay
+        self._ring       = HashRing(self._collectors)
+        self._handler    = BatchHandler(serverPort, self._send, batchSize, maxLatency)
+        self._sockets    = {}
+        self._retryAt    = {}
+        self._maxLatency = maxLatency
+        self._closed     = threading.Event()
+        self._flusher    = None
+        if maxLatency is not None:
+            self._flusher = threading.Thread(target=self._flushLate, daemon=True)
+            self._flusher.start()
+        self._flowSeqs   = {}
+        self._dropped    = 0
+
+
+    ##  Decodes a packet, sending events once a batch is full or its oldest
+    #   packet is `maxLatency` old.
+    #   @param  pkt Scapy packet.
+    def __call__(self, pkt):
+        self._handler(pkt)
+
+
+    def _flushLate(self):
+        while not self._closed.wait(self._maxLatency / 4):
+            self._handler.flushLate()
+
+
+    def _send(self, batch):
+        parts = {}
+        for i in range(batch.nbPackets()):
+            flow = batch.flows[i]
+            collector = self._ring.nodeFor(flow)
+            flowSeqs,part = parts.setdefault(collector, ([], EventBatch()))
+            flowSeqs.append(self._flowSeqs.get(flow, 0))
+            self._flowSeqs[flow] = flowSeqs[-1] + 1
+            part.appendPacket(batch, i)
+
+        for collector,(flowSeqs,part) in parts.items():
+            if time.monotonic() < self._retryAt.get(collector, 0):
+                self._dropped += part.nbPackets()
+                continue
+
+            message = encodeMessage(self._sensorId, flowSeqs, part, self._level)
+            try:
+                self._socket(collector).sendall(message)
+            except OSError:
+                # Unreachable or stuck collector, retried after a delay.
+                sock = self._sockets.pop(collector, None)
+                if sock is not None:
+                    sock.close()
+                self._retryAt[collector] = time.monotonic() + self._retryDelay
+                self._dropped += part.nbPackets()
+
+
+    def _socket(self, collector):
+        if collector not in self._sockets:
+            self._sockets[collector] = socket.create_connection(collector, self._timeout)
+
+        return self._sockets[collector]
+
+
+    ##  Returns the number of packets that could not be sent.
+    #   @return The number of packets that could not be sent.
+    def getDropped(self):
+        """ Returns the number of packets that could not be sent. """
+        return self._dropped
+
+
+    ##  Sends pending events and closes the connections.
+    def close(self):
+        """ Sends pending events and closes the connections. """
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self._handler.flush()
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets.clear()
+
+
+class _CollectorHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            header = _recvExactly(self.request, HEADER.size)
+            if header is None:
+                break
+
+            size,sensorId = HEADER.unpack(header)
+            payload = _recvExactly(self.request, size)
+            if payload is None:
+                break
+
+            self.server.collector.feed(sensorId, *decodePayload(payload))
+
+
+class _CollectorServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+##  Collector owning automata and evaluating the events sent by sensors.
+class Collector(object):
+    """ Collector owning automata and evaluating the events sent by sensors. """
+
+    ##  Constructor.
+    #   @param  address         (host, port) address to listen on.
+    #   @param  yamlPath        Input Yaml file path.
+    #   @param  callbackFactory Returns a `callback(seqNb, parsed)` from a list
+    #                           of automata.
+    def __init__(self, address, yamlPath, callbackFactory):
+        self._yamlPath   = yamlPath
+        self._factory    = callbackFactory
+        self._automata   = fromYaml(yamlPath)
+        self._callback   = callbackFactory(self._automata)
+        self._lock       = threading.Lock()
+        self._lastSeqs   = {}
+        self._stats      = {"packets": 0, "gaps": 0, "deviations": 0}
+        self._server     = _CollectorServer(tuple(address), _CollectorHandler)
+        self._server.collector = self
+
+
+    ##  Returns the address the collector listens on.
+    #   @return The (host, port) address of the collector.
+    def getAddress(self):
+        """ Returns the address the collector listens on. """
+        return self._server.server_address
+
+
+    ##  Evaluates a batch of events received from a sensor.
+    #   Packets of a flow are numbered by their sensor, a missing number is
+    #   accounted as a gap.
+    #   @param  sensorId    Identifier of the sending sensor.
+    #   @param  flowSeqs    Per-flow sequence number of each packet.
+    #   @param  batch       Event batch.
+    def feed(self, sensorId, flowSeqs, batch):
+        """ Evaluates a batch of events received from a sensor. """
+        with self._lock:
+            for i in range(batch.nbPackets()):
+                key = (sensorId, batch.flows[i])
+                expected = self._lastSeqs.get(key, -1) + 1
+                if flowSeqs[i] != expected:
+                    self._stats["gaps"] += 1
+                self._lastSeqs[key] = flowSeqs[i]
+
+                self._stats["packets"] += 1
+                try:
+                    self._callback(batch.seqNbs[i], batch.toParsed(i))
+                except errors.TransitionError:
+                    self._stats["deviations"] += 1
+
+
+    ##  Reloads the Yaml file, rebuilding only the changed automata.
+    #   Batches received meanwhile wait for the reload to complete.
+    def reload(self):
+        """ Reloads the Yaml file, rebuilding only the changed automata. """
+        with self._lock:
+            self._automata = reloadYaml(self._yamlPath, self._automata)
+            self._callback = self._factory(self._automata)
+
+
+    ##  Returns the statistics of the collector.
+    #   @return A dict of the packets, gaps and deviations counters.
+    def getStats(self):
+        """ Returns the statistics of the collector. """
+        with self._lock:
+            return dict(self._stats)
+
+
+    ##  Serves sensors until `shutdown` is called.
+    def serveForever(self):
+        """ Serves sensors until `shutdown` is called. """
+        self._server.serve_forever()
+
+
+    ##  Stops serving and closes the listening socket.
+    def shutdown(self):
+        """ Stops serving and closes the listening socket. """
+        self._server.shutdown()
+        self._server.server_close()
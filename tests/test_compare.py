@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+from test_core import _load, DIVERGING_OUTPUTS, INPUTS
+
+
+## DIVERGING_OUTPUTS with a different output on A -> B.
+CHANGED_OUTPUTS = [
+    ("A", "B", "[(coil1, True)]", "[(out, False)]"),
+] + DIVERGING_OUTPUTS[1:]
+
+
+def _compare(modelSets, **kwargs):
+    comparison = icscrack.ModelComparison(modelSets, ["old", "new"], **kwargs)
+    for i,msgL in enumerate(INPUTS):
+        comparison.feed(i, msgL)
+
+    return comparison
+
+
+def test_identicalModels():
+    comparison = _compare([[_load(DIVERGING_OUTPUTS, False)], [_load(DIVERGING_OUTPUTS, True)]])
+    assert comparison.getDivergences() == []
+    assert comparison.getCounts() == {}
+
+
+def test_changedModel():
+    comparison = _compare([[_load(DIVERGING_OUTPUTS, False)], [_load(CHANGED_OUTPUTS, False)]])
+    divergences = comparison.getDivergences()
+    assert len(divergences) == 1
+    assert (divergences[0].packet, divergences[0].seqNb, divergences[0].automaton) == (2, 2, "test")
+    assert divergences[0].outcomes == {
+        "old": ("transition", "B", (("out", True),)),
+        "new": ("transition", "B", (("out", False),)),
+    }
+    assert comparison.getCounts() == {"test": 1}
+    assert "[test] 1 divergences" in comparison.report()
+
+
+def test_absentAutomaton():
+    comparison = _compare([[_load(DIVERGING_OUTPUTS, False)], []], maxDivergences=1)
+    assert len(comparison.getDivergences()) == 1
+    assert comparison.getDivergences()[0].outcomes["new"] == ("absent",)
+    assert comparison.getCounts() == {"test": len(INPUTS)}
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+import os
+import tempfile
+import warnings
+
+
+VARIABLES = {
+    "coil1": ("Coil", 1),
+    "coil2": ("Coil", 2),
+    "out": ("Coil", 3),
+}
+
+
+def _writeJFF(path, start, transitions):
+    states = sorted(set([start] + [_[0] for _ in transitions] + [_[1] for _ in transitions]))
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?><structure>',
+        "    <type>mealy</type>",
+        "    <automaton>",
+    ]
+    for i,state in enumerate(states):
+        lines.append('        <state id="{}" name="{}">{}</state>'.format(
+            i, state, "<initial/>" if state == start else ""
+        ))
+    for nodeFrom,nodeTo,read,output in transitions:
+        lines.append(
+            "        <transition><from>{}</from><to>{}</to>"
+            "<read>{}</read><transout>{}</transout></transition>".format(
+                states.index(nodeFrom), states.index(nodeTo), read, output
+            )
+        )
+    lines += ["    </automaton>", "</structure>"]
+
+    with open(path, "w") as handle:
+        handle.write("\n".join(lines))
+
+
+def _load(transitions, minimize, start="A"):
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "behavior.jff")
+        _writeJFF(path, start, transitions)
+        return icscrack.Automaton.fromJFF("test", path, VARIABLES, minimize)
+
+
+def _run(automaton, inputs):
+    res = []
+    for msgL in inputs:
+        try:
+            res.append(automaton.update(msgL))
+        except icscrack.errors.TransitionError:
+            res.append("deviation")
+
+    return res
+
+
+## Equivalent targets of a same state with different outputs.
+DIVERGING_OUTPUTS = [
+    ("A", "B", "[(coil1, True)]", "[(out, True)]"),
+    ("A", "C", "[(coil1, False)]", "[(out, False)]"),
+    ("B", "A", "[(coil2, True)]", "[]"),
+    ("C", "A", "[(coil2, True)]", "[]"),
+]
+
+## Equivalent targets of a same state with the same output.
+SAME_OUTPUTS = [
+    ("A", "B", "[(coil1, True)]", "[(out, True)]"),
+    ("A", "C", "[(coil1, False)]", "[(out, True)]"),
+    ("B", "A", "[(coil2, True)]", "[]"),
+    ("C", "A", "[(coil2, True)]", "[]"),
+    ("D", "A", "[(coil2, True)]", "[]"),
+]
+
+INPUTS = [
+    {("Coil", 1): False},
+    {("Coil", 2): True},
+    {("Coil", 1): True, ("Coil", 2): False},
+    {("Coil", 2): True},
+    {("Coil", 1): False, ("Coil", 2): False},
+]
+
+
+def test_minimizeKeepsOutputs():
+    for transitions in (DIVERGING_OUTPUTS, SAME_OUTPUTS):
+        expected = _run(_load(transitions, False), INPUTS)
+        minimized = _load(transitions, True)
+        res = [
+            _ if _ in (None, "deviation") else ("|".join(minimized.getAliases(_[0])), _[1])
+            for _ in _run(minimized, INPUTS)
+        ]
+        for got,want in zip(res, expected):
+            if want in (None, "deviation"):
+                assert got == want
+            else:
+                assert want[0] in got[0].split("|")
+                assert got[1] == want[1]
+
+
+def test_minimizeMergesStates():
+    automaton = _load(SAME_OUTPUTS, True)
+    assert sorted(automaton._states.values()) == ["A", "B"]
+    assert automaton.getAliases("B") == ("B", "C")
+    assert automaton.getAliases("A") == ("A",)
+
+    automaton = _load(DIVERGING_OUTPUTS, True)
+    assert sorted(automaton._states.values()) == ["A", "B", "C"]
+
+
+def test_analyzeGuards():
+    automaton = _load([
+        ("A", "B", "[(coil1, True)]", "[]"),
+        ("A", "C", "[(coil1, True), (coil2, True)]", "[]"),
+        ("A", "D", "[(coil2, False)]", "[]"),
+        ("A", "A", "[(coil1, True), (coil1, False)]", "[]"),
+    ], False)
+    conflicts = {(kind, guard1, guard2) for kind,_,guard1,guard2 in automaton.getConflicts()}
+
+    coil1 = ((("Coil", 1), True),)
+    coil12 = ((("Coil", 1), True), (("Coil", 2), True))
+    notCoil2 = ((("Coil", 2), False),)
+    unsat = ((("Coil", 1), True), (("Coil", 1), False))
+    assert ("shadowed", coil12, coil1) in conflicts
+    assert ("nondeterministic", coil1, notCoil2) in conflicts
+    assert ("unsatisfiable", unsat, unsat) in conflicts
+    assert not any(coil12 in _[1:] and notCoil2 in _[1:] for _ in conflicts)
+
+
+def test_analyzeGuardsStrict():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "behavior.jff")
+        _writeJFF(path, "A", [
+            ("A", "B", "[(coil1, True)]", "[(out, True)]"),
+            ("A", "C", "[(coil2, True)]", "[(out, False)]"),
+        ])
+        try:
+            icscrack.Automaton.fromJFF("test", path, VARIABLES, strict=True)
+        except icscrack.errors.ParseError:
+            pass
+        else:
+            assert False, "ParseError expected"
+
+
+def test_checkpoint():
+    automaton = _load(DIVERGING_OUTPUTS, True)
+    automaton.update({("Coil", 1): True})
+    checkpoint = automaton.getCheckpoint()
+    expected = _run(automaton, INPUTS)
+
+    automaton = _load(DIVERGING_OUTPUTS, True)
+    automaton.restore(checkpoint)
+    assert _run(automaton, INPUTS) == expected
+
+
+def _writeYaml(tmpDir, plc):
+    _writeJFF(os.path.join(tmpDir, "behavior.jff"), "A", SAME_OUTPUTS)
+    path = os.path.join(tmpDir, "topology.yaml")
+    with open(path, "w") as handle:
+        handle.write("\n".join([
+            "topology:",
+            "    servers:",
+            "        plc:",
+        ] + ["            " + _ for _ in plc] + [
+            "    clients:",
+            "        hmi:",
+            "            variables: {coil1: [Coil, 1]}",
+        ]))
+
+    return path
+
+
+def test_yamlAgents():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = _writeYaml(tmpDir, [
+            "variables: {coil1: [Coil, 1], coil2: [Coil, 2], out: [Coil, 3]}",
+            "behavior: behavior.jff",
+        ])
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            automata = icscrack.fromYaml(path)
+
+        assert [_.getName() for _ in automata] == ["plc"]
+        assert any("hmi" in str(_.message) for _ in caught)
+
+        path = _writeYaml(tmpDir, ["behavior: behavior.jff"])
+        try:
+            icscrack.fromYaml(path)
+        except icscrack.errors.ParseError:
+            pass
+        else:
+            assert False, "ParseError expected"
+
+
+def test_guardsOrder():
+    examples = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+    automaton = [
+        _ for _ in icscrack.fromYaml(os.path.join(examples, "bottles", "bottles.yaml"))
+        if _.getName() == "bottleFactory"
+    ][0]
+
+    # Nondeterministic guards {processRun=False} and {bottleInPlace=True,
+    # level=False} of Moving: the first one in JFF order wins.
+    automaton.restore(("Moving", {}))
+    res = automaton.update({
+        ("HoldingRegister", 0x10): False,
+        ("HoldingRegister", 0x02): True,
+        ("HoldingRegister", 0x01): False,
+    })
+    assert res[0] == "Iddle"
+
+    # A guard strictly containing another one is tried first.
+    automaton = _load([
+        ("A", "B", "[(coil1, True)]", "[]"),
+        ("A", "C", "[(coil1, True), (coil2, True)]", "[(out, True)]"),
+    ], False)
+    assert automaton.update({("Coil", 1): True, ("Coil", 2): True})[0] == "C"
+
+
+def test_reloadYaml():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        _writeJFF(os.path.join(tmpDir, "plc1.jff"), "A", DIVERGING_OUTPUTS)
+        _writeJFF(os.path.join(tmpDir, "plc2.jff"), "A", DIVERGING_OUTPUTS)
+        path = os.path.join(tmpDir, "topology.yaml")
+        with open(path, "w") as handle:
+            handle.write("\n".join(["topology:", "    servers:"] + [
+                "        {0}: {{behavior: {0}.jff, variables: {{coil1: [Coil, 1], "
+                "coil2: [Coil, 2], out: [Coil, 3]}}}}".format(_) for _ in ("plc1", "plc2")
+            ] + ["    clients: {}"]))
+
+        automata = icscrack.fromYaml(path)
+        for automaton in automata:
+            automaton.update({("Coil", 1): True})
+            assert automaton.getState() == "B"
+        checkpoint = automata[0].getCheckpoint()
+
+        res = icscrack.reloadYaml(path, automata)
+        assert all(new is old for new,old in zip(res, automata))
+
+        _writeJFF(os.path.join(tmpDir, "plc2.jff"), "A", SAME_OUTPUTS)
+        res = icscrack.reloadYaml(path, automata)
+        assert [_.getName() for _ in res] == ["plc1", "plc2"]
+        assert res[0] is automata[0] and res[0].getState() == "B"
+        assert res[1] is not automata[1] and res[1].getState() == "A"
+        assert res[0].getCheckpoint() == checkpoint
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+from icscrack.events import EventBatch
+
+
+def _batch():
+    batch = EventBatch()
+    batch.beginPacket(1, flow=7, ts=1.5)
+    batch.extend("ReadReq", "Coil", [0, 1, 2])
+    batch.beginPacket(1, flow=7, ts=1.75)
+    batch.extend("ReadResp", "Coil", [0, 1, 2], [1, 0, 1])
+    batch.beginPacket(2, flow=9, ts=2.)
+    batch.extend("WriteReq", "HoldingRegister", [40, 41], [65535, 12])
+    batch.extend("WriteReq", "Coil", [3], [0])
+    return batch
+
+
+def test_roundTrip():
+    batch = _batch()
+    res = EventBatch.fromBytes(batch.toBytes())
+    for column in EventBatch.__slots__:
+        assert getattr(res, column) == getattr(batch, column)
+
+    assert res.nbPackets() == 3
+    assert res.toParsed(1) == batch.toParsed(1)
+    assert res.messages(2) == {
+        ("HoldingRegister", 40): 65535,
+        ("HoldingRegister", 41): 12,
+        ("Coil", 3): False,
+    }
+
+
+def test_emptyRoundTrip():
+    res = EventBatch.fromBytes(EventBatch().toBytes())
+    assert res.nbPackets() == 0
+    assert len(res) == 0
+
+
+def test_appendPacket():
+    batch = _batch()
+    res = EventBatch()
+    res.appendPacket(batch, 2)
+    assert res.nbPackets() == 1
+    assert res.packet(0) == (2, 9, 2., 0, 3)
+    assert res.toParsed(0) == batch.toParsed(2)
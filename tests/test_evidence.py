@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+import os
+import tempfile
+
+import scapy.all as scpy
+
+from icscrack.pcap import CaptureFile
+
+
+SERVER_PORT = 5020
+
+
+def _frame(i, clientPort=40000):
+    pkt = (scpy.Ether() / scpy.IP(src="10.0.0.1", dst="10.0.0.2")
+           / scpy.TCP(sport=clientPort, dport=SERVER_PORT) / scpy.Raw(load=bytes([i])))
+    pkt.time = i
+    return pkt
+
+
+def _loads(path):
+    with CaptureFile(path) as capture:
+        return [capture.toPacket(*_[1:])[scpy.Raw].load[0] for _ in capture]
+
+
+def test_windows():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        recorder = icscrack.EvidenceRecorder(SERVER_PORT, os.path.join(tmpDir, "out"), before=4, after=3)
+        for i in range(10):
+            recorder.record(_frame(i))
+            recorder.record(_frame(100 + i, 40001))
+        path = recorder.trigger(icscrack.modbus.flowId(_frame(0), SERVER_PORT))
+        assert not os.path.exists(path)
+
+        for i in range(10, 20):
+            recorder.record(_frame(i))
+        assert _loads(path) == list(range(6, 13))
+
+
+def test_coalesce():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        recorder = icscrack.EvidenceRecorder(SERVER_PORT, tmpDir, before=4, after=3, maxFrames=12)
+        paths = []
+        for i in range(40):
+            recorder.record(_frame(i))
+            if i in (5, 7, 9, 30):
+                paths.append(recorder.trigger())
+        recorder.flush()
+
+        assert paths[0] == paths[1] == paths[2] != paths[3]
+        assert sorted(os.listdir(tmpDir)) == sorted(os.path.basename(_) for _ in set(paths))
+        assert _loads(paths[0]) == list(range(2, 13))
+        assert _loads(paths[3]) == list(range(27, 34))
+
+        recorder = icscrack.EvidenceRecorder(SERVER_PORT, tmpDir, before=4, after=100, maxFrames=8)
+        for i in range(20):
+            recorder.record(_frame(i))
+            if i == 5:
+                path = recorder.trigger()
+        assert _loads(path) == list(range(2, 10))
+
+
+def test_bounds():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        recorder = icscrack.EvidenceRecorder(SERVER_PORT, tmpDir, before=2, after=5, maxFlows=2, maxPending=1)
+        assert recorder.trigger() is None
+
+        for clientPort in (40000, 40001, 40002):
+            for i in range(5):
+                recorder.record(_frame(i, clientPort))
+        assert recorder.trigger(icscrack.modbus.flowId(_frame(0, 40000), SERVER_PORT)) is None
+
+        first = recorder.trigger(icscrack.modbus.flowId(_frame(0, 40001), SERVER_PORT))
+        second = recorder.trigger()
+        assert _loads(first) == [3, 4]
+        assert not os.path.exists(second)
+
+        recorder.record(_frame(100, 40000))
+        recorder.flush()
+        assert _loads(second) == [3, 4]
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+import os
+import random
+import struct
+import tempfile
+
+import scapy.all as scpy
+
+from icscrack.index import Index, IndexEntry, FLAG_RESPONSE, FLAG_SYNC
+from icscrack.pcap import CaptureFile, writeCapture
+
+
+SERVER_PORT = 5020
+
+
+def _frame(request, load, ts, client="10.0.0.1", server="10.0.0.2"):
+    if request:
+        pkt = (scpy.Ether() / scpy.IP(src=client, dst=server)
+               / scpy.TCP(sport=40000, dport=SERVER_PORT) / scpy.Raw(load=load))
+    else:
+        pkt = (scpy.Ether() / scpy.IP(src=server, dst=client)
+               / scpy.TCP(sport=SERVER_PORT, dport=40000) / scpy.Raw(load=load))
+    pkt.time = ts
+    return pkt
+
+
+def _writeRegister(seqNb, addr, value, ts):
+    load = struct.pack(">HHHBBHH", seqNb, 0, 6, 1, 6, addr, value)
+    return [_frame(True, load, ts), _frame(False, load, ts + 0.001)]
+
+
+def _index():
+    return Index(5020, 1, [
+        IndexEntry(24, 1.5, 7, 1, 1, FLAG_SYNC, 0, 3),
+        IndexEntry(90, 1.75, 7, 1, 1, FLAG_RESPONSE, 0, 3),
+        IndexEntry(160, 2., 9, 2, 16, FLAG_SYNC, 40, 2),
+        IndexEntry(230, 2.25, 9, 2, 16, FLAG_RESPONSE, 40, 2),
+    ], [
+        (0, {"plc": ("Idle", {("Coil", 0): None, ("HoldingRegister", 40): None})}),
+        (2, {"plc": ("Running", {("Coil", 0): True, ("HoldingRegister", 40): 12})}),
+    ], {
+        7: (("10.0.0.1", 40000), ("10.0.0.2", 5020)),
+        9: (("10.0.0.1", 40001), ("10.0.0.3", 5020)),
+    })
+
+
+def test_roundTrip():
+    index = _index()
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "capture.idx")
+        index.save(path)
+        res = Index.load(path)
+
+    assert res.getServerPort() == 5020
+    assert len(res) == len(index)
+    assert [res[_] for _ in range(len(res))] == [index[_] for _ in range(len(index))]
+    for position in range(len(index)):
+        assert res.checkpoint(position) == index.checkpoint(position)
+    assert res.getEndpoints(9) == (("10.0.0.1", 40001), ("10.0.0.3", 5020))
+
+
+def test_truncated():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "capture.idx")
+        _index().save(path)
+        with open(path, "rb") as handle:
+            data = handle.read()
+        with open(path, "wb") as handle:
+            handle.write(data[:-1])
+
+        try:
+            Index.load(path)
+        except icscrack.errors.CaptureError:
+            pass
+        else:
+            assert False, "CaptureError expected"
+
+
+def test_select():
+    index = _index()
+    assert index.select(flow=9) == [2, 3]
+    assert index.select(fnCodes=[1]) == [0, 1]
+    assert index.select(addresses=(2, 39)) == [0, 1]
+    assert index.select(start=1.6, end=2.) == [1, 2]
+    assert index.select(server="10.0.0.3") == [2, 3]
+    assert index.select(server="10.0.0.4") == []
+    assert index.syncPoint(1) == 0
+    assert index.checkpoint(1)[0] == 0
+    assert index.checkpoint(3)[1]["plc"][0] == "Running"
+
+
+def test_buildUnmatchedResponse():
+    frames = _writeRegister(1, 0x10, 1, 10.)[1:] + _writeRegister(2, 0x10, 0, 11.)
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "capture.pcap")
+        scpy.wrpcap(path, frames)
+        index = Index.build(path, SERVER_PORT)
+
+    assert len(index) == 3
+    assert index[0].flags == FLAG_RESPONSE
+    assert (index[0].first, index[0].nbAddr) == (0, 0)
+    assert index[1].flags == FLAG_SYNC
+    assert (index[2].first, index[2].nbAddr) == (0x10, 1)
+
+
+def _readRegisters(seqNb, values, ts):
+    body = b"".join(struct.pack(">H", _) for _ in values)
+    return [
+        _frame(True, struct.pack(">HHHBBHH", seqNb, 0, 6, 1, 3, 1, len(values)), ts),
+        _frame(False, struct.pack(">HHHBBB", seqNb, 0, 3 + len(body), 1, 3, len(body)) + body, ts + 0.005),
+    ]
+
+
+def _deviations(automata, res):
+    def callback(seqNb, parsed):
+        for automaton in automata:
+            try:
+                automaton.update(icscrack.modbus.inputMessages(parsed))
+            except icscrack.errors.TransitionError:
+                res.append((seqNb, automaton.getName()))
+
+    return callback
+
+
+def test_buildAnalyze():
+    yamlPath = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "examples", "bottles", "bottles.yaml"
+    )
+    rand = random.Random(3)
+    frames = []
+    for seqNb in range(200):
+        frames += _readRegisters(seqNb, [rand.random() < .5 for _ in range(16)], 1000. + seqNb / 100.)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        pcapPath = os.path.join(tmpDir, "capture.pcap")
+        indexPath = os.path.join(tmpDir, "capture.idx")
+        scpy.wrpcap(pcapPath, frames)
+        Index.build(pcapPath, SERVER_PORT, icscrack.fromYaml(yamlPath), checkpointEvery=16).save(indexPath)
+        index = Index.load(indexPath)
+        assert len(index) == len(frames)
+
+        automata = icscrack.fromYaml(yamlPath)
+        full = []
+        icscrack.index.analyze(pcapPath, index, _deviations(automata, full))
+        assert full
+
+        for start,end in ((1000.5, 1001.2), (1001.23, 1001.99)):
+            # Inputs of read requests come with their responses.
+            seqNbs = {
+                index[_].seqNb for _ in index.select(start=start, end=end)
+                if index[_].flags & FLAG_RESPONSE
+            }
+            automata = icscrack.fromYaml(yamlPath)
+            res = []
+            icscrack.index.analyze(
+                pcapPath, index, _deviations(automata, res), _deviations(automata, []),
+                automata, start=start, end=end
+            )
+            assert sorted(res) == sorted(_ for _ in full if _[0] in seqNbs)
+
+
+def _writeRawCapture(path, magic, order, frames):
+    with open(path, "wb") as handle:
+        handle.write(magic + struct.pack(order + "HHiIII", 2, 4, 0, 0, 65535, 1))
+        for sec,frac,data in frames:
+            handle.write(struct.pack(order + "IIII", sec, frac, len(data), len(data)))
+            handle.write(data)
+
+
+def test_captureHeaders():
+    data = bytes(_frame(True, b"\x00" * 12, 0.))
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "capture.pcap")
+        for magic,order,frac,ts in (
+                (b"\xd4\xc3\xb2\xa1", "<", 250000, 12.25),
+                (b"\xa1\xb2\xc3\xd4", ">", 250000, 12.25),
+                (b"\x4d\x3c\xb2\xa1", "<", 250000000, 12.25),
+                (b"\xa1\xb2\x3c\x4d", ">", 1, 12.000000001)):
+            _writeRawCapture(path, magic, order, [(12, frac, data), (13, 0, data[:20])])
+            with CaptureFile(path) as capture:
+                assert capture.linktype == 1
+                res = list(capture)
+                assert [_[0] for _ in res] == [24, 24 + 16 + len(data)]
+                assert abs(res[0][1] - ts) < 1e-12
+                assert res[0][2] == data and res[1][2] == data[:20]
+                assert capture.readAt(res[1][0]) == res[1][1:]
+                assert capture.toPacket(*res[0][1:])[scpy.TCP].dport == SERVER_PORT
+
+        with open(path, "wb") as handle:
+            handle.write(b"\x0a\x0d\x0d\x0a" + b"\x00" * 20)
+        try:
+            CaptureFile(path)
+        except icscrack.errors.CaptureError:
+            pass
+        else:
+            assert False, "CaptureError expected"
+
+
+def test_writeCapture():
+    frames = [(5.25, bytes(_frame(True, b"\x00" * 12, 0.))), (6.9999999, b"\x01\x02")]
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "capture.pcap")
+        writeCapture(path, 1, frames)
+        with CaptureFile(path) as capture:
+            res = [_[1:] for _ in capture]
+
+        assert res == [(5.25, frames[0][1]), (7., frames[1][1])]
+        assert scpy.rdpcap(path)[0][scpy.TCP].dport == SERVER_PORT
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+import functools
+import multiprocessing as mp
+import os
+import random
+import struct
+
+import scapy.all as scpy
+
+from icscrack.pipeline import SharedRing, encodeEvents, decodeEvents
+
+
+SERVER_PORT = 5020
+
+YAML_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "examples", "bottles", "bottles.yaml"
+)
+
+
+def _records(nbRecords, seqNb=1):
+    res = [[0, 0, 1, addr, addr % 2, seqNb, 7, 1.5] for addr in range(nbRecords)]
+    res[-1][2] |= 2
+    return [tuple(_) for _ in res]
+
+
+def _frame(request, load, ts, clientPort):
+    if request:
+        pkt = (scpy.Ether() / scpy.IP(src="10.0.0.1", dst="10.0.0.2")
+               / scpy.TCP(sport=clientPort, dport=SERVER_PORT) / scpy.Raw(load=load))
+    else:
+        pkt = (scpy.Ether() / scpy.IP(src="10.0.0.2", dst="10.0.0.1")
+               / scpy.TCP(sport=SERVER_PORT, dport=clientPort) / scpy.Raw(load=load))
+    pkt.time = ts
+    return pkt
+
+
+def _capture():
+    rand = random.Random(5)
+    res = []
+    for seqNb in range(120):
+        clientPort = 40000 + seqNb // 40
+        res.append(_frame(True, struct.pack(">HHHBBHH", seqNb, 0, 6, 1, 3, 1, 16), seqNb, clientPort))
+        body = b"".join(struct.pack(">H", rand.random() < .5) for _ in range(16))
+        res.append(_frame(
+            False,
+            struct.pack(">HHHBBB", seqNb, 0, 3 + len(body), 1, 3, len(body)) + body,
+            seqNb + 0.5,
+            clientPort
+        ))
+
+    return res
+
+
+def _updater(deviations, automata):
+    def callback(seqNb, parsed):
+        msgL = icscrack.modbus.inputMessages(parsed)
+        if msgL:
+            for automaton in automata:
+                try:
+                    automaton.update(msgL)
+                except icscrack.errors.TransitionError:
+                    deviations.put((automaton.getName(), seqNb))
+
+    return callback
+
+
+def test_pushPop():
+    ring = SharedRing(8)
+    try:
+        assert ring.pop() is None
+        assert ring.push(_records(3, 1))
+        assert ring.push(_records(4, 2))
+        assert ring.pop() == _records(3, 1)
+        assert ring.push(_records(3, 3))
+        assert ring.pop() == _records(4, 2)
+        assert ring.pop() == _records(3, 3)
+        assert ring.pop() is None
+        assert ring.getStats()["pending"] == 0
+    finally:
+        ring.release(unlink=True)
+
+
+def test_drops():
+    ring = SharedRing(8)
+    try:
+        assert ring.push(_records(6))
+        assert not ring.push(_records(3))
+        assert not ring.push(_records(9), block=True)
+        assert not ring.push(_records(3), block=True, timeout=0.01)
+        stats = ring.getStats()
+        assert (stats["droppedPackets"], stats["droppedEvents"]) == (3, 15)
+        assert stats["pending"] == 6
+
+        ring.setDead()
+        ring.pop()
+        assert not ring.push(_records(1), block=True)
+        assert ring.getStats()["exited"]
+        assert ring.getStats()["droppedPackets"] == 4
+    finally:
+        ring.release(unlink=True)
+
+
+def test_encodeEvents():
+    batch = icscrack.EventBatch()
+    load = struct.pack(">HHHBBHH", 3, 0, 6, 1, 6, 0x10, 1)
+    icscrack.modbus.decodePacket(_frame(True, load, 2., 40000), SERVER_PORT, batch)
+    icscrack.modbus.decodePacket(_frame(False, load, 2.5, 40000), SERVER_PORT)
+
+    seqNb,_,ts,parsed = decodeEvents(encodeEvents(batch, 0))
+    assert (seqNb, ts) == (3, 2.)
+    assert parsed == batch.toParsed(0)
+    assert encodeEvents(batch, 0, keep=set()) == []
+    assert decodeEvents(encodeEvents(batch, 0, key=42))[1] == 42
+
+
+def test_livePipeline():
+    capture = _capture()
+    deviations = mp.SimpleQueue()
+    handler = icscrack.modbusHandler(SERVER_PORT, _updater(deviations, icscrack.fromYaml(YAML_PATH)))
+    for pkt in capture:
+        handler(pkt)
+    expected = []
+    while not deviations.empty():
+        expected.append(deviations.get())
+    assert expected
+
+    for partition in ("automaton", "server"):
+        pipeline = icscrack.LivePipeline(
+            SERVER_PORT, YAML_PATH, functools.partial(_updater, deviations), 2, partition, block=True
+        )
+        pipeline.start()
+        for pkt in capture:
+            pipeline(pkt)
+        stats = pipeline.close()
+
+        res = []
+        while not deviations.empty():
+            res.append(deviations.get())
+        assert not any(_["droppedPackets"] for _ in stats)
+        assert sorted(res) == sorted(expected), partition
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from context import icscrack
+
+import os
+import socket
+import struct
+import threading
+import time
+
+import scapy.all as scpy
+
+from icscrack.transport import encodeMessage
+
+
+SERVER_PORT = 5020
+
+YAML_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "examples", "bottles", "bottles.yaml"
+)
+
+
+def _frame(seqNb, clientPort):
+    pkt = (scpy.Ether() / scpy.IP(src="10.0.0.1", dst="10.0.0.2")
+           / scpy.TCP(sport=clientPort, dport=SERVER_PORT)
+           / scpy.Raw(load=struct.pack(">HHHBBHH", seqNb, 0, 6, 1, 6, 0x10, seqNb % 2)))
+    pkt.time = seqNb
+    return pkt
+
+
+def _ignore(automata):
+    return lambda seqNb, parsed: None
+
+
+def _start():
+    collector = icscrack.Collector(("127.0.0.1", 0), YAML_PATH, _ignore)
+    threading.Thread(target=collector.serveForever, daemon=True).start()
+    return collector
+
+
+def _waitPackets(collectors, nbPackets, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if sum(_.getStats()["packets"] for _ in collectors) >= nbPackets:
+            break
+        time.sleep(0.01)
+
+    return [_.getStats() for _ in collectors]
+
+
+def test_sensorCollectors():
+    collectors = [_start() for _ in range(2)]
+    try:
+        sensor = icscrack.Sensor(SERVER_PORT, [_.getAddress() for _ in collectors], batchSize=4)
+        for seqNb in range(30):
+            sensor(_frame(seqNb, 40000 + seqNb % 5))
+        sensor.close()
+
+        stats = _waitPackets(collectors, 30)
+        assert sum(_["packets"] for _ in stats) == 30
+        assert not any(_["gaps"] for _ in stats)
+        assert sensor.getDropped() == 0
+    finally:
+        for collector in collectors:
+            collector.shutdown()
+        icscrack.modbus.resetQueues()
+
+
+def test_maxLatency():
+    collector = _start()
+    try:
+        sensor = icscrack.Sensor(SERVER_PORT, [collector.getAddress()], batchSize=64, maxLatency=0.1)
+        sensor(_frame(1, 40000))
+        assert _waitPackets([collector], 1, timeout=2.)[0]["packets"] == 1
+        sensor.close()
+    finally:
+        collector.shutdown()
+        icscrack.modbus.resetQueues()
+
+
+def test_gaps():
+    collector = _start()
+    try:
+        batch = icscrack.EventBatch()
+        for seqNb in range(4):
+            icscrack.modbus.decodePacket(_frame(seqNb, 40000), SERVER_PORT, batch)
+
+        with socket.create_connection(collector.getAddress()) as sock:
+            sock.sendall(encodeMessage(3, [0, 1, 3, 4], batch))
+        stats = _waitPackets([collector], 4)[0]
+        assert (stats["packets"], stats["gaps"]) == (4, 1)
+    finally:
+        collector.shutdown()
+        icscrack.modbus.resetQueues()
+
+
+def test_unreachableCollector():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        address = sock.getsockname()
+
+    sensor = icscrack.Sensor(SERVER_PORT, [address], batchSize=2, retryDelay=60.)
+    try:
+        for seqNb in range(6):
+            sensor(_frame(seqNb, 40000))
+        assert sensor.getDropped() == 6
+    finally:
+        sensor.close()
+        icscrack.modbus.resetQueues()